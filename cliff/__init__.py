@@ -1,4 +1,32 @@
 """load public class"""
-from .metadata import MetaData, Scenery
-from .ruggness import Ruggness
-from .epistasis import Epistasis
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .epistasis import Epistasis
+    from .metadata import MetaData, Scenery
+    from .ruggness import Ruggness
+
+# public classes by the module defining them, a module is imported when
+# one of its classes is first used, so that `cliff.client` and light jobs
+# never import the plotting and parallel stack of `epistasis`
+_MODULES = {
+    "MetaData": ".metadata",
+    "Scenery": ".metadata",
+    "Ruggness": ".ruggness",
+    "Epistasis": ".epistasis",
+}
+
+__all__ = list(_MODULES)
+
+
+def __getattr__(name: str):
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,3 @@
+"""benchmark of every stage on reproducible synthetic landscapes"""
+from .landscape import MODELS, synthetic_scenery
+from .suite import BenchCase, run_case, run_suite
@@ -0,0 +1,136 @@
+"""reproducible synthetic fitness landscapes"""
+from typing import Optional
+
+import numpy as np
+
+from cliff.parser.base import Scenery
+
+# residues of synthetic sequences, the first `alphabet_size` are used
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+MODELS = ("additive", "pairwise", "nk")
+
+
+def library_codes(
+    sequence_num: Optional[int],
+    sequence_length: int,
+    alphabet_size: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    distinct sequences of the combinatorial library as a N x L code matrix,
+    the whole library if `sequence_num` is None
+    """
+    library = alphabet_size ** sequence_length
+    if sequence_num is None or sequence_num >= library:
+        index = np.arange(library)
+    elif library < 2 ** 62:
+        index = np.sort(rng.choice(library, sequence_num, replace=False))
+    else:
+        # too large to number, random sequences hardly ever repeat
+        matrix = np.zeros((0, sequence_length), dtype=np.uint8)
+        while len(matrix) < sequence_num:
+            more = rng.integers(0, alphabet_size, (sequence_num, sequence_length),
+                                dtype=np.uint8)
+            matrix = np.unique(np.vstack([matrix, more]), axis=0)
+        return matrix[np.sort(rng.choice(len(matrix), sequence_num, replace=False))]
+    # digits of library index, the last residue changes fastest
+    powers = alphabet_size ** np.arange(sequence_length - 1, -1, -1)
+    return (index[:, None] // powers % alphabet_size).astype(np.uint8)
+
+
+def partners(sequence_length: int, k: int, rng: np.random.Generator) -> np.ndarray:
+    """`k` random other residues interacting with every residue, L x k"""
+    k = min(k, sequence_length - 1)
+    return np.array([
+        rng.choice(np.delete(np.arange(sequence_length), res), k, replace=False)
+        for res in range(sequence_length)
+    ], dtype=np.int64).reshape(sequence_length, k)
+
+
+def landscape_fitness(
+    matrix: np.ndarray,
+    alphabet_size: int,
+    model: str,
+    k: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    fitness of every sequence
+
+    `additive` sums a random effect of every residue, `pairwise` adds
+    random couplings of every residue with `k` partners, and `nk` averages
+    a random table of every residue indexed by it and its `k` partners
+    """
+    assert model in MODELS, f"model should be one of {MODELS}"
+    sequence_length = matrix.shape[1]
+    residues = np.arange(sequence_length)
+    if model == "nk":
+        linked = partners(sequence_length, k, rng)
+        index = matrix.astype(np.int64)
+        for column in range(linked.shape[1]):
+            index = index * alphabet_size + matrix[:, linked[:, column]]
+        table = rng.random((sequence_length, alphabet_size ** (linked.shape[1] + 1)))
+        return table[residues, index].mean(axis=1)
+
+    field = rng.normal(size=(sequence_length, alphabet_size))
+    fitness = field[residues, matrix].sum(axis=1)
+    if model == "pairwise":
+        linked = partners(sequence_length, k, rng)
+        for column in range(linked.shape[1]):
+            coupling = rng.normal(
+                scale=0.5, size=(sequence_length, alphabet_size, alphabet_size))
+            fitness += coupling[residues, matrix,
+                                matrix[:, linked[:, column]]].sum(axis=1)
+    return fitness
+
+
+def synthetic_scenery(
+    sequence_length: int,
+    alphabet_size: int = 4,
+    sequence_num: Optional[int] = None,
+    missing: float = 0.0,
+    model: str = "pairwise",
+    k: int = 1,
+    seed: int = 0,
+) -> Scenery:
+    """
+    make an encoded scenery of a synthetic landscape, the same for the same
+    arguments
+
+    Parameters
+    ----------
+    sequence_length: int
+        residues of a sequence
+
+    alphabet_size: int
+        variables of a residue, the first of `AMINO_ACIDS`
+
+    sequence_num: Optional[int]
+        distinct sequences drawn from the library, None for all of it
+
+    missing: float
+        fraction of drawn sequences left out, as unmeasured variants
+
+    model: str
+        one of `additive`, `pairwise` and `nk`, see `landscape_fitness`
+
+    k: int
+        interacting partners of every residue
+
+    seed: int
+        seed of random generator
+    """
+    assert 1 <= alphabet_size <= len(AMINO_ACIDS), \
+        f"alphabet_size should be in [1, {len(AMINO_ACIDS)}]"
+    assert 0.0 <= missing < 1.0, "missing should be in [0, 1)"
+    rng = np.random.default_rng(seed)
+    matrix = library_codes(sequence_num, sequence_length, alphabet_size, rng)
+    fitness = landscape_fitness(matrix, alphabet_size, model, k, rng)
+    keep = np.sort(rng.choice(
+        len(matrix), int(round(len(matrix) * (1.0 - missing))), replace=False))
+
+    sce = Scenery()
+    sce.alphabet = AMINO_ACIDS[:alphabet_size]
+    sce.matrix = matrix[keep]
+    sce.fitness = fitness[keep]
+    return sce
@@ -0,0 +1,149 @@
+"""timing and peak memory of every stage on synthetic landscapes"""
+import os
+import time
+import tracemalloc
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from cliff.epistasis import Epistasis
+from cliff.metadata import MetaData
+from cliff.parser import BinParser, SeqArgs, SeqParser, Scenery
+from cliff.ruggness import Ruggness
+from cliff.bench.landscape import synthetic_scenery
+
+Record = Dict[str, Any]
+
+
+class BenchCase:
+    """a synthetic landscape and the calculation benchmarked on it"""
+
+    def __init__(
+        self,
+        sequence_length: int,
+        alphabet_size: int = 4,
+        sequence_num: Optional[int] = None,
+        missing: float = 0.0,
+        model: str = "pairwise",
+        k: int = 1,
+        max_order: int = 2,
+        seed: int = 0,
+        n_jobs: int = 1,
+        backend: str = "sequential",
+        solver: str = "tree",
+    ) -> None:
+        self.sequence_length = sequence_length
+        self.alphabet_size = alphabet_size
+        self.sequence_num = sequence_num
+        self.missing = missing
+        self.model = model
+        self.k = k
+        self.max_order = min(max_order, sequence_length)
+        self.seed = seed
+        self.n_jobs = n_jobs
+        self.backend = backend
+        self.solver = solver
+
+    def params(self) -> Record:
+        """parameters of the case, shared by its records"""
+        return dict(vars(self))
+
+    def scenery(self) -> Scenery:
+        """make the synthetic scenery"""
+        return synthetic_scenery(
+            self.sequence_length, self.alphabet_size, self.sequence_num,
+            self.missing, self.model, self.k, self.seed)
+
+    def stages(self, folder: str) -> Iterator[Tuple[str, Record]]:
+        """
+        run the calculation, yield name and counters of every stage
+        as soon as it is finished, files of `prepare` are in `folder`
+        """
+        args = SeqArgs()
+        args.sequence_label = "sequence"
+        args.fitness_label = "fitness"
+        scenery = SeqParser.parse(os.path.join(folder, "landscape.csv"), args)
+        yield "parse-csv", {"sequences": len(scenery.fitness)}
+
+        scenery = BinParser.parse(os.path.join(folder, "landscape.cliff"))
+        yield "parse-bin", {"sequences": len(scenery.fitness)}
+
+        meta = MetaData(scenery, scenery.alphabet, cache=False)
+        meta.get_neighbour(tqdm_enable=False)
+        yield "neighbour", {"edges": meta.neighbour.edge_num}
+
+        rug = Ruggness(meta).calculate()
+        yield "ruggness", {"ruggness": rug}
+
+        calculator = Epistasis(
+            scenery, self.max_order, scenery.alphabet, n_jobs=self.n_jobs,
+            backend=self.backend, solver=self.solver, cache=False)
+        calculator.meta.neighbour = meta.neighbour
+        for order, epi in calculator.iter_orders():
+            yield f"epistasis-{order}", {"keys": len(epi)}
+
+    def prepare(self, folder: str) -> None:
+        """write the scenery as a csv and a binary dataset into `folder`"""
+        scenery = self.scenery()
+        pd.DataFrame({"sequence": scenery.sequence, "fitness": scenery.fitness}).to_csv(
+            os.path.join(folder, "landscape.csv"), index=False)
+        MetaData(scenery, scenery.alphabet, cache=False).save(
+            os.path.join(folder, "landscape.cliff"))
+
+
+def timed(stages: Iterator[Tuple[str, Record]], trace: bool) -> List[Record]:
+    """
+    wall time and cpu time of every stage, and peak memory allocated
+    inside it if `trace`, which slows down stages so is run apart
+    """
+    records = []
+    if trace:
+        tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    for stage, counters in stages:
+        record = {"stage": stage,
+                  "seconds": time.perf_counter() - wall,
+                  "cpu_seconds": time.process_time() - cpu,
+                  **counters}
+        if trace:
+            record["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            # restart for the peak of the next stage alone
+            tracemalloc.stop()
+            tracemalloc.start()
+        records.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+    if trace:
+        tracemalloc.stop()
+    return records
+
+
+def run_case(case: BenchCase, repeat: int = 3) -> List[Record]:
+    """
+    benchmark every stage of a case, the best time of `repeat` runs
+    and the peak memory of another traced run, memory of process
+    workers of `Epistasis` is not traced
+
+    Returns
+    -------
+    records : List[Record]
+        parameters of the case, stage, `seconds`, `cpu_seconds`,
+        `peak_bytes` and counters of the stage
+    """
+    assert repeat >= 1, "repeat should be positive"
+    with TemporaryDirectory() as folder:
+        case.prepare(folder)
+        runs = [timed(case.stages(folder), trace=False) for _ in range(repeat)]
+        traced = timed(case.stages(folder), trace=True)
+
+    records = []
+    for index, record in enumerate(traced):
+        record["seconds"] = min(run[index]["seconds"] for run in runs)
+        record["cpu_seconds"] = min(run[index]["cpu_seconds"] for run in runs)
+        records.append({**case.params(), "repeat": repeat, **record})
+    return records
+
+
+def run_suite(cases: List[BenchCase], repeat: int = 3) -> List[Record]:
+    """benchmark every case, records of all cases in order"""
+    return [record for case in cases for record in run_case(case, repeat)]
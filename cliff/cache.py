@@ -0,0 +1,106 @@
+"""persistent cache of neighbour graphs, keyed by dataset fingerprint"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# directory of the cache, which turns it on, empty or `off` to disable it
+CACHE_DIR_ENV = "CLIFF_CACHE_DIR"
+# size limit in bytes of the default cache
+CACHE_SIZE_ENV = "CLIFF_CACHE_SIZE"
+DEFAULT_CACHE_SIZE = 4 << 30
+
+
+def fingerprint(matrix: np.ndarray, alphabet: str, positions: Sequence[int]) -> str:
+    """hash of encoded sequences, alphabet and mutated residues"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(
+        [list(matrix.shape), alphabet, [int(i) for i in positions]]).encode())
+    digest.update(np.ascontiguousarray(matrix).data)
+    return digest.hexdigest()
+
+
+class NeighbourCache:
+    """
+    content-addressed directory of neighbour graphs, every graph is saved as
+    `.npy` arrays with a json of other attributes and loaded memory-mapped,
+    the least recently used graphs are evicted when the directory grows
+    over `max_bytes`
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_SIZE) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def default(cls, enable: bool = False) -> Optional[NeighbourCache]:
+        """
+        cache configured by environment, None if disabled, the cache is off
+        unless `CLIFF_CACHE_DIR` is set, or `enable` asks for it, which
+        defaults to `~/.cache/cliff`
+        """
+        directory = os.environ.get(CACHE_DIR_ENV)
+        if directory is None and enable:
+            directory = os.path.join(
+                os.environ.get("XDG_CACHE_HOME",
+                               os.path.join(os.path.expanduser("~"), ".cache")),
+                "cliff")
+        if directory in (None, "", "off"):
+            return None
+        max_bytes = int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+        return cls(directory, max_bytes)
+
+    def path(self, key: str) -> str:
+        """directory of a graph"""
+        return os.path.join(self.directory, key)
+
+    def load(self, key: str) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+        """memory-map arrays and read attributes of a graph, None if missing"""
+        path = self.path(key)
+        try:
+            with open(os.path.join(path, "graph.json"), encoding="utf-8") as file:
+                info = json.load(file)
+            arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                      for name in info["arrays"]}
+        except (OSError, ValueError, KeyError):
+            return None
+        # mark as recently used
+        os.utime(path)
+        return arrays, info["attributes"]
+
+    def store(self, key: str, arrays: Dict[str, np.ndarray], attributes: Dict[str, Any]) -> None:
+        """save arrays and attributes of a graph, then evict old graphs over size limit"""
+        os.makedirs(self.directory, exist_ok=True)
+        temp = self.path(f".{key}.{uuid.uuid4().hex}")
+        os.makedirs(temp)
+        for name, array in arrays.items():
+            np.save(os.path.join(temp, f"{name}.npy"), array)
+        with open(os.path.join(temp, "graph.json"), "w", encoding="utf-8") as file:
+            json.dump({"arrays": list(arrays), "attributes": attributes}, file)
+        try:
+            os.rename(temp, self.path(key))
+        except OSError:
+            # stored by another process meanwhile
+            shutil.rmtree(temp, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> None:
+        """remove least recently used graphs until under size limit"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self.path(name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
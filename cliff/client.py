@@ -1,10 +1,151 @@
 """intro of argument program"""
+import functools
+from itertools import product
+import json
+import logging
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple, Union
+
 import click
 
-from .parser import SeqParser, MutParser, SeqArgs, MutArgs
-from .epistasis import Epistasis
-from .ruggness import Ruggness
-from .metadata import MetaData
+if TYPE_CHECKING:
+    from .progress import Progress
+
+# calculators are imported inside commands, so that `cliff --help`
+# only imports click, and a command only the modules it uses
+
+
+def fitness_label(fitness: Tuple[str, ...]) -> Union[str, List[str], None]:
+    """fitness label of parser args, a list for several `-f` of N x K fitness"""
+    if len(fitness) == 0:
+        return None
+    return fitness[0] if len(fitness) == 1 else list(fitness)
+
+
+def column_names(columns: int, labels: Optional[Sequence[str]]) -> List[str]:
+    """names of fitness columns, their labels or indexes"""
+    return list(labels) if labels else [str(column) for column in range(columns)]
+
+
+def echo_ruggness(rug, labels: Optional[Sequence[str]]) -> None:
+    """echo ruggness, of every column for N x K fitness"""
+    if getattr(rug, "ndim", 0) == 0:
+        click.echo(f"Ruggness: {rug}")
+        return
+    for name, value in zip(column_names(len(rug), labels), rug):
+        click.echo(f"Ruggness [{name}]: {value}")
+
+
+def profile_option(command):
+    """add `--profile` to a command, which writes a report of its stages"""
+    @click.option('--profile', help='write wall time, cpu time, peak memory and counters '
+                  'of every stage into a json file', type=click.Path())
+    @functools.wraps(command)
+    def wrapper(*args, profile=None, **kwargs):
+        if profile is None:
+            return command(*args, **kwargs)
+        # pylint: disable=import-outside-toplevel
+        from .metrics import profiling
+
+        with profiling() as report:
+            result = command(*args, **kwargs)
+        report.save(profile)
+        click.echo(f'Profile: saved to {profile}')
+        return result
+    return wrapper
+
+
+def save_plots(calculator, epi) -> None:
+    """plot epistasis into `output.png`, or `output_<label>.png` of every fitness column"""
+    if not calculator.possible_keys:
+        click.echo('Epistasis probability: no residue key left to plot, skipped')
+        return
+    if calculator.fitness.ndim == 1:
+        outputs = [(None, 'output.png')]
+    else:
+        outputs = [(column, f'output_{name}.png') for column, name in enumerate(
+            column_names(calculator.fitness.shape[1], calculator.meta.fitness_labels))]
+    for column, output in outputs:
+        fig = calculator.to_draw(epi, column).plot()
+        fig.savefig(output)
+        click.echo(f'Epistasis probability: saved to {output}')
+
+
+def interval_option(command):
+    """add `--bootstrap` and `--jackknife` to a ruggness command, echoing the interval"""
+    @click.option('--bootstrap', help='bootstrap replicates of a confidence interval, 0 for none',
+                  type=int, default=0)
+    @click.option('--jackknife', help='jackknife standard error and interval', is_flag=True)
+    @click.option('--unit', help='resampled unit of an interval',
+                  type=click.Choice(['variant', 'edge']), default='variant')
+    @functools.wraps(command)
+    def wrapper(*args, bootstrap=0, jackknife=False, unit='variant', **kwargs):
+        # a streamed dataset is not held for resampling
+        if kwargs.get('stream') and (bootstrap or jackknife):
+            raise click.UsageError('--bootstrap and --jackknife are not available with --stream')
+        calculator = command(*args, **kwargs)
+        if not (bootstrap or jackknife):
+            return
+        if calculator.fitness.ndim == 1:
+            columns = [(None, '')]
+        else:
+            columns = [(column, f' [{name}]') for column, name in enumerate(
+                column_names(calculator.fitness.shape[1], calculator.meta.fitness_labels))]
+        for column, name in columns:
+            if jackknife:
+                interval = calculator.interval(method='jackknife', unit=unit, column=column)
+            else:
+                interval = calculator.interval(bootstrap, unit=unit, n_jobs=-1, column=column)
+            click.echo(f"Standard error{name}: {interval.std_error}")
+            click.echo(f"{interval.confidence:.0%} interval{name}: "
+                       f"[{interval.low}, {interval.high}]")
+    return wrapper
+
+
+def decompose_option(command):
+    """
+    add `--by-position` and `--by-mutation` to a ruggness command, which
+    are passed to `echo_decomposed` to write contributions as csv tables
+    """
+    command = click.option('--by-mutation', help='write contribution of every mutation to '
+                           'ruggness into a csv file', type=click.Path())(command)
+    return click.option('--by-position', help='write contribution of every position to '
+                        'ruggness into a csv file', type=click.Path())(command)
+
+
+def echo_decomposed(calculator, labels: Optional[Sequence[str]],
+                    by_position: Optional[str], by_mutation: Optional[str]) -> None:
+    """
+    echo ruggness of a calculator, decomposed in the same pass when
+    contributions by position or by mutation are written as csv tables
+    """
+    if by_position is None and by_mutation is None:
+        echo_ruggness(calculator.calculate(), labels)
+        return
+    decomposition = calculator.decompose()
+    echo_ruggness(decomposition.ruggness, labels)
+    for path, table in ((by_position, decomposition.positions),
+                        (by_mutation, decomposition.mutations)):
+        if path is not None:
+            table().to_csv(path, index=False)
+            click.echo(f'Decomposition: saved to {path}')
+
+
+def progress_option(command):
+    """add `--progress` to a command, which passes a `Progress` as `progress`"""
+    @click.option('--progress', help='report progress as tqdm bars, json log lines or nothing',
+                  type=click.Choice(['bar', 'log', 'none']), default='bar')
+    @functools.wraps(command)
+    def wrapper(*args, progress='bar', **kwargs):
+        # pylint: disable=import-outside-toplevel
+        from .progress import NO_PROGRESS, LogProgress, TqdmProgress
+
+        if progress == 'log':
+            logging.basicConfig(level=logging.INFO)
+            receiver = LogProgress()
+        else:
+            receiver = TqdmProgress() if progress == 'bar' else NO_PROGRESS
+        return command(*args, progress=receiver, **kwargs)
+    return wrapper
 
 
 @click.group()
@@ -15,125 +156,253 @@ def cli():
 @cli.command()
 @click.argument('filename', type=click.Path(exists=True))
 @click.option('-s', '--symbol', help='mutation label of csv file', type=str)
-@click.option('-f', '--fitness', help='fitness label of csv file', type=str)
+@click.option('-f', '--fitness', help='fitness label of csv file, repeated for '
+              'several fitness columns', type=str, multiple=True)
 @click.option('-w', '--wild_type', help='wild type sequence of dataset', type=str)
 @click.option('-v', '--vt_offset', help='index offset of dataset', type=int, default=0)
 @click.option('-c', '--chars', help='input variables for sequence',
               default='ACDEFGHIKLMNPQRSTVWY', type=str)
-def rug_mut(filename: str, symbol: str, fitness: str, wild_type: str, vt_offset: int, chars: str):
+@progress_option
+@profile_option
+@interval_option
+@decompose_option
+def rug_mut(filename: str, symbol: str, fitness: Tuple[str, ...], wild_type: str,
+            vt_offset: int, chars: str, by_position: Optional[str],
+            by_mutation: Optional[str], progress: 'Progress'):
     """calculate ruggness on mutation format dataset"""
+    # pylint: disable=import-outside-toplevel
+    from .parser import MutParser, MutArgs
+    from .ruggness import Ruggness
+    from .metadata import MetaData
+
     click.echo('[Mutation] Dataset -> [Ruggness] cauculation')
     click.echo(f'file: {filename}')
     click.echo('[Mutation] Args:')
     click.echo(
-        f'mutation label: [{symbol}], fitness label:[{fitness}], offset:[{vt_offset}]')
+        f'mutation label: [{symbol}], fitness label:[{fitness_label(fitness)}], '
+        f'offset:[{vt_offset}]')
     click.echo(f'variables: [{chars}]')
     click.echo(f'wile type: [{wild_type}]')
 
     args = MutArgs()
     args.mutation_label = symbol
-    args.fitness_label = fitness
+    args.fitness_label = fitness_label(fitness)
     args.wile_type = wild_type
     args.vt_offset = vt_offset
     scenery = MutParser.parse(filename, args)
     meta = MetaData(scenery, chars)
+    meta.get_neighbour(progress=progress)
 
     calculator = Ruggness(meta)
-    rug = calculator.calculate()
-    click.echo(f"Ruggness: {rug}")
+    echo_decomposed(calculator, meta.fitness_labels, by_position, by_mutation)
+    return calculator
 
 
 @cli.command()
 @click.argument('filename', type=click.Path(exists=True))
 @click.option('-s', '--symbol', help='mutation label of csv file', type=str)
-@click.option('-f', '--fitness', help='fitness label of csv file', type=str)
+@click.option('-f', '--fitness', help='fitness label of csv file, repeated for '
+              'several fitness columns', type=str, multiple=True)
 @click.option('-c', '--chars', help='input variables for sequence',
               default='ACDEFGHIKLMNPQRSTVWY', type=str)
-def rug_seq(filename: str, symbol: str, fitness: str, chars: str):
+@click.option('--stream', help='read dataset chunk by chunk without building its '
+              'neighbour graph', is_flag=True)
+@click.option('--chunksize', help='rows of a chunk when streaming', type=int, default=100000)
+@progress_option
+@profile_option
+@interval_option
+@decompose_option
+def rug_seq(filename: str, symbol: str, fitness: Tuple[str, ...], chars: str, stream: bool,
+            chunksize: int, by_position: Optional[str], by_mutation: Optional[str],
+            progress: 'Progress'):
     """calculate ruggness on sequence format dataset"""
+    # pylint: disable=import-outside-toplevel
+    from .parser import SeqParser, SeqArgs
+    from .ruggness import Ruggness, StreamRuggness
+    from .metadata import MetaData
+
     click.echo('[Sequence] Dataset -> [Epistasis] cauculation')
     click.echo(f'file: {filename}')
     click.echo('[Sequence] Args:')
-    click.echo(f'sequence label: [{symbol}], fitness label:[{fitness}]')
+    click.echo(f'sequence label: [{symbol}], fitness label:[{fitness_label(fitness)}]')
     click.echo(f'variables: [{chars}]')
 
     args = SeqArgs()
     args.sequence_label = symbol
-    args.fitness_label = fitness
-    scenery = SeqParser.parse(filename, args)
-    meta = MetaData(scenery, chars)
-
-    calculator = Ruggness(meta)
-    rug = calculator.calculate()
-    click.echo(f"Ruggness: {rug}")
+    args.fitness_label = fitness_label(fitness)
+    if stream:
+        click.echo(f'streaming: [{chunksize}] rows per chunk')
+        calculator = StreamRuggness.from_csv(filename, args, chars, chunksize, progress)
+    else:
+        scenery = SeqParser.parse(filename, args)
+        meta = MetaData(scenery, chars)
+        meta.get_neighbour(progress=progress)
+        calculator = Ruggness(meta)
+    echo_decomposed(calculator, fitness if stream else calculator.meta.fitness_labels,
+                    by_position, by_mutation)
+    return calculator
 
 
 @cli.command()
 @click.argument('filename', type=click.Path(exists=True))
 @click.option('-s', '--symbol', help='mutation label of csv file', type=str)
-@click.option('-f', '--fitness', help='fitness label of csv file', type=str)
+@click.option('-f', '--fitness', help='fitness label of csv file, repeated for '
+              'several fitness columns', type=str, multiple=True)
 @click.option('-w', '--wild_type', help='wild type sequence of dataset', type=str)
 @click.option('-v', '--vt_offset', help='index offset of dataset', type=int, default=0)
 @click.option('-c', '--chars', help='input variables for sequence',
               default='ACDEFGHIKLMNPQRSTVWY', type=str)
 @click.option('-o', '--max_order', help='max order of epistasis calculation', type=int)
-def epi_mut(filename: str, symbol: str, fitness: str, wild_type: str,
-            vt_offset: int, chars: str, max_order: int):
+@click.option('-j', '--jobs', help='number of workers, -1 for all cpus', type=int, default=-1)
+@progress_option
+@profile_option
+def epi_mut(filename: str, symbol: str, fitness: Tuple[str, ...], wild_type: str,
+            vt_offset: int, chars: str, max_order: int, jobs: int, progress: 'Progress'):
     """calculate epistasis on mutation format dataset"""
+    # pylint: disable=import-outside-toplevel
+    from .parser import MutParser, MutArgs
+    from .epistasis import Epistasis
+
     click.echo('[Mutation] Dataset -> [Epistasis] cauculation')
     click.echo(f'file: {filename}')
     click.echo('[Mutation] Args:')
     click.echo(
-        f'mutation label: [{symbol}], fitness label:[{fitness}], offset:[{vt_offset}]')
+        f'mutation label: [{symbol}], fitness label:[{fitness_label(fitness)}], '
+        f'offset:[{vt_offset}]')
     click.echo(f'variables: [{chars}]')
     click.echo(f'wile type: [{wild_type}]')
     click.echo('[Epistasis] Args:')
-    click.echo(f'order range: [1-{max_order}]')
+    click.echo(f'order range: [1-{max_order}], workers: [{jobs}]')
 
     args = MutArgs()
     args.mutation_label = symbol
-    args.fitness_label = fitness
+    args.fitness_label = fitness_label(fitness)
     args.wile_type = wild_type
     args.vt_offset = vt_offset
     scenery = MutParser.parse(filename, args)
 
-    calculator = Epistasis(scenery, max_order, chars)
+    calculator = Epistasis(scenery, max_order, chars, n_jobs=jobs, progress=progress)
     epi = calculator.calculate()
 
-    show_model = calculator.to_draw(epi)
-    fig = show_model.plot()
-    fig.savefig('output.png')
-    click.echo('Epistasis probability: saved to output.png')
+    save_plots(calculator, epi)
 
 
 @cli.command()
 @click.argument('filename', type=click.Path(exists=True))
 @click.option('-s', '--symbol', help='mutation label of csv file', type=str)
-@click.option('-f', '--fitness', help='fitness label of csv file', type=str)
+@click.option('-f', '--fitness', help='fitness label of csv file, repeated for '
+              'several fitness columns', type=str, multiple=True)
 @click.option('-c', '--chars', help='input variables for sequence',
               default='ACDEFGHIKLMNPQRSTVWY', type=str)
 @click.option('-o', '--max_order', help='max order of epistasis calculation', type=int)
-def epi_seq(filename: str, symbol: str, fitness: str, chars: str, max_order: int):
+@click.option('-j', '--jobs', help='number of workers, -1 for all cpus', type=int, default=-1)
+@progress_option
+@profile_option
+def epi_seq(filename: str, symbol: str, fitness: Tuple[str, ...], chars: str,
+            max_order: int, jobs: int, progress: 'Progress'):
     """calculate epistasis on sequence format dataset"""
+    # pylint: disable=import-outside-toplevel
+    from .parser import SeqParser, SeqArgs
+    from .epistasis import Epistasis
+
     click.echo('[Sequence] Dataset -> [Epistasis] cauculation')
     click.echo(f'file: {filename}')
     click.echo('[Sequence] Args:')
-    click.echo(f'sequence label: [{symbol}], fitness label:[{fitness}]')
+    click.echo(f'sequence label: [{symbol}], fitness label:[{fitness_label(fitness)}]')
     click.echo(f'variables: [{chars}]')
-    click.echo(f'order range: [1-{max_order}]')
+    click.echo(f'order range: [1-{max_order}], workers: [{jobs}]')
 
     args = SeqArgs()
     args.sequence_label = symbol
-    args.fitness_label = fitness
+    args.fitness_label = fitness_label(fitness)
     scenery = SeqParser.parse(filename, args)
 
-    calculator = Epistasis(scenery, max_order, chars)
+    calculator = Epistasis(scenery, max_order, chars, n_jobs=jobs, progress=progress)
     epi = calculator.calculate()
 
-    show_model = calculator.to_draw(epi)
-    fig = show_model.plot()
-    fig.savefig('output.png')
-    click.echo('Epistasis probability: saved to output.png')
+    save_plots(calculator, epi)
+
+
+@cli.command()
+@click.argument('filename', type=click.Path(exists=True))
+@click.argument('output', type=click.Path())
+@click.option('-s', '--symbol', help='sequence or mutation label of csv file', type=str)
+@click.option('-f', '--fitness', help='fitness label of csv file, repeated for '
+              'several fitness columns', type=str, multiple=True)
+@click.option('-w', '--wild_type',
+              help='wild type sequence of mutation format dataset, omit for sequence format',
+              type=str)
+@click.option('-v', '--vt_offset', help='index offset of dataset', type=int, default=0)
+@click.option('-c', '--chars', help='input variables for sequence',
+              default='ACDEFGHIKLMNPQRSTVWY', type=str)
+@profile_option
+def convert(filename: str, output: str, symbol: str, fitness: Tuple[str, ...],
+            wild_type: str, vt_offset: int, chars: str):
+    """convert a csv dataset into a binary dataset, which loads without parsing"""
+    # pylint: disable=import-outside-toplevel
+    from .parser import SeqParser, MutParser, SeqArgs, MutArgs
+    from .metadata import MetaData
+
+    if wild_type is None:
+        click.echo('[Sequence] Dataset -> [Binary] Dataset')
+        args = SeqArgs()
+        args.sequence_label = symbol
+        args.fitness_label = fitness_label(fitness)
+        scenery = SeqParser.parse(filename, args)
+    else:
+        click.echo('[Mutation] Dataset -> [Binary] Dataset')
+        args = MutArgs()
+        args.mutation_label = symbol
+        args.fitness_label = fitness_label(fitness)
+        args.wile_type = wild_type
+        args.vt_offset = vt_offset
+        scenery = MutParser.parse(filename, args)
+    click.echo(f'file: {filename}')
+    click.echo(f'variables: [{chars}]')
+
+    meta = MetaData(scenery, chars, cache=False)
+    meta.save(output, fitness_label=fitness_label(fitness), source=filename)
+    click.echo(f'Binary dataset: saved to {output}')
+
+
+@cli.command()
+@click.option('-l', '--length', help='residues of a sequence, repeat for more cases',
+              type=int, multiple=True, default=(4, 8))
+@click.option('-a', '--alphabet_size', help='variables of a residue, repeat for more cases',
+              type=int, multiple=True, default=(4,))
+@click.option('-n', '--num', help='sequences drawn from the library, repeat for more cases, '
+              'whole library by default', type=int, multiple=True)
+@click.option('-m', '--missing', help='fraction of sequences left out', type=float, default=0.0)
+@click.option('--model', help='fitness model of landscape',
+              type=click.Choice(['additive', 'pairwise', 'nk']), default='pairwise')
+@click.option('-k', help='interacting partners of every residue', type=int, default=1)
+@click.option('-o', '--max_order', help='max order of epistasis calculation', type=int, default=2)
+@click.option('-j', '--jobs', help='number of workers of epistasis', type=int, default=1)
+@click.option('-b', '--backend', help='scheduler backend of epistasis',
+              type=click.Choice(['loky', 'threading', 'sequential']), default='sequential')
+@click.option('-r', '--repeat', help='runs of every case, the best time is kept',
+              type=int, default=3)
+@click.option('--seed', help='seed of synthetic landscapes', type=int, default=0)
+@click.option('--output', help='write json records to a file instead of stdout',
+              type=click.Path())
+@profile_option
+def bench(length: tuple, alphabet_size: tuple, num: tuple, missing: float, model: str,
+          k: int, max_order: int, jobs: int, backend: str, repeat: int, seed: int,
+          output: str):
+    """benchmark every stage on synthetic landscapes, one case per length, size and num"""
+    # pylint: disable=import-outside-toplevel
+    from .bench import BenchCase, run_suite
+
+    cases = [BenchCase(one_length, one_size, one_num, missing, model, k, max_order,
+                       seed, jobs, backend)
+             for one_length, one_size, one_num in product(length, alphabet_size, num or (None,))]
+    records = run_suite(cases, repeat)
+    if output is None:
+        click.echo(json.dumps(records, indent=2))
+    else:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(records, file, indent=2)
+        click.echo(f'Benchmark: {len(records)} records saved to {output}')
 
 
 if __name__ == '__main__':
@@ -1,146 +1,423 @@
 """utils for cauculating epistasis"""
-from bisect import insort
-from itertools import combinations
-from typing import Generator, Union, cast, List, Tuple, Dict, Set
+from functools import lru_cache
+from itertools import combinations, groupby
+from math import comb
+from typing import Iterator, Optional, Sequence, List, Tuple, Dict
 
-import networkx as nx
+import numpy as np
 
-from cliff.metadata import Seq, MultiResidue
+from cliff.metadata import Dictionary, Seq, MultiResidue, NeighbourGraph, group_sum
+from cliff import metrics
 
 SeqDiff = Tuple[Seq, Seq]
 EpiResidue = Dict[Seq, float]
 EpiNet = Dict[MultiResidue, EpiResidue]
 
 
-def select_substr(
-    src: Union[str, Seq, List[str]], select: Union[MultiResidue, List[int]]
-) -> Seq:
-    """
-    select sequence subset from string
+class EpiLink:
+    """neighbour edges grouped by mutated residue, shared by all residue keys"""
 
-    Parameters
-    ----------
-    src: str
-        target string to be select
+    def __init__(self, neighbour: NeighbourGraph, sequence_length: int) -> None:
+        by_position = np.argsort(neighbour.position, kind="stable")
+        self.source: np.ndarray = neighbour.source[by_position]
+        self.target: np.ndarray = neighbour.target[by_position]
+        # edges mutated at residue `i` are `bounds[i]:bounds[i + 1]`
+        self.bounds: np.ndarray = np.searchsorted(
+            neighbour.position[by_position], np.arange(sequence_length + 1))
 
-    select: List[int]
-        list of index to select
+    def select(self, key: MultiResidue) -> Tuple[np.ndarray, np.ndarray]:
+        """source and target of edges mutated at any residue of `key`"""
+        edges = np.concatenate(
+            [np.arange(self.bounds[res], self.bounds[res + 1]) for res in key])
+        return self.source[edges], self.target[edges]
 
-    Returns
-    -------
-    substr : List[str]
-        selected sub-string
 
-    Examples
-    --------
-    >> assert(select_substr("ABCDE", [0, 2, 3]) == ('A', 'C', 'E'))
-    """
-    if isinstance(select, set):
-        select = sorted(List(select))
-    select = cast(List[int], select)
-    return tuple(src[s] for s in select)
+# number of set bits of every byte
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int64)
 
 
-def mk_combine_subset(
-    all_res: Tuple[MultiResidue],
-) -> List[Tuple[MultiResidue]]:
+class KeySupport:
+    """
+    sequences supporting residue keys, a sequence supports a key if it has
+    a neighbour mutated at every residue of the key, so that a key is never
+    supported by more sequences than any of its subsets
     """
-    generate combination of multiply residues
 
-    Parameters
-    ----------
-    all_res: Tuple[MultiResidue]
-        several residues of comb input
+    def __init__(self, neighbour: NeighbourGraph, residues: Sequence[int]) -> None:
+        residues = list(residues)
+        self.row = {res: i for i, res in enumerate(residues)}
+        row_of = np.full(max(residues, default=-1) + 1, -1, dtype=np.int64)
+        row_of[residues] = np.arange(len(residues))
+        position = neighbour.position
+        inside = position < len(row_of)
+        inside[inside] = row_of[position[inside]] >= 0
+        touched = np.zeros((len(residues), len(neighbour)), dtype=bool)
+        touched[row_of[position[inside]], neighbour.source[inside]] = True
+        # bits of supporting sequences of every residue
+        self.bits: np.ndarray = np.packbits(touched, axis=1)
+
+    def count(self, key: MultiResidue) -> int:
+        """number of sequences supporting a key"""
+        bits = np.bitwise_and.reduce(self.bits[[self.row[res] for res in key]], axis=0)
+        return int(POPCOUNT[bits].sum())
+
+
+def grow_keys(keys: List[MultiResidue]) -> Iterator[MultiResidue]:
+    """
+    keys of one more residue, whose every subset of one less residue is
+    in `keys`, in lexicographic order if `keys` is
 
-    Returns
-    -------
-    comb : List[Tuple[MultiResidue]]
-        result of combinations
+    Examples
+    --------
+    >> assert(list(grow_keys([(0, 1), (0, 2), (1, 2), (1, 3)])) == [(0, 1, 2)])
+    """
+    kept = set(keys)
+    for _, block in groupby(keys, key=lambda key: key[:-1]):
+        block = list(block)
+        for i, low in enumerate(block):
+            for high in block[i + 1:]:
+                key = low + high[-1:]
+                if all(sub in kept for sub in combinations(key, len(low))):
+                    yield key
+
+
+@lru_cache(maxsize=None)
+def subset_columns(order: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    columns of every proper subset of a key of `order` residues,
+    ordered by size, then lexicographically
 
     Examples
     --------
-    >> assert(mk_combine_subset(((1, 2), (3, 4))) == (((1, 2),), ((3, 4),), ((1, 2), (3, 4))))
+    >> assert(subset_columns(3) == ((0,), (1,), (2,), (0, 1), (0, 2), (1, 2)))
     """
-    ret: List[Tuple[MultiResidue]] = []
-    for order in range(1, len(all_res)):
-        once: List[Tuple[MultiResidue]] = sorted(
-            list(combinations(all_res, order))
-        )
-        ret.extend(once)
-    return ret
+    return tuple(columns for size in range(1, order)
+                 for columns in combinations(range(order), size))
 
 
-def mk_combine(num: int, max_order: int) -> List[MultiResidue]:
+class KeyIndex:
     """
-    generate combination of order 1 to max_order
-    for [1, 2, ..., n] input
+    dense integer ids of residue keys made of `residues` up to `max_order`,
+    by the combinatorial number system, a key of columns c_1 < ... < c_k
+    in `residues` is `offset[k] + C(c_1, 1) + ... + C(c_k, k)`, so that
+    keys of lower order come first
 
-    Parameters
-    ----------
-    num: int
-        input elements range
+    Examples
+    --------
+    >> assert(KeyIndex([2, 5, 7], 2).rank(np.array([[2, 5], [5, 7]])).tolist() == [3, 5])
+    """
+
+    def __init__(self, residues: Sequence[int], max_order: int) -> None:
+        residues = np.asarray(residues, dtype=np.int64)
+        size = len(residues)
+        counts = [comb(size, order) for order in range(max_order + 1)]
+        assert sum(counts) < 2 ** 63, "too many keys for integer ids"
+        self.column = np.full(residues.max(initial=-1) + 1, -1, dtype=np.int64)
+        self.column[residues] = np.arange(size)
+        # id of the first key of every order
+        self.offset = np.cumsum([0, 0] + counts[1:max_order]).astype(np.int64)
+        # `binom[c, i]` is C(c, i)
+        self.binom = np.array([[comb(col, i) for i in range(max_order + 1)]
+                               for col in range(size)], dtype=np.int64
+                              ).reshape(size, max_order + 1)
+
+    def rank(self, keys: np.ndarray) -> np.ndarray:
+        """ids of keys of the same order, a row of sorted residues each"""
+        keys = np.asarray(keys, dtype=np.int64).reshape(len(keys), -1)
+        order = keys.shape[1]
+        columns = self.column[keys]
+        return self.offset[order] + self.binom[
+            columns, np.arange(1, order + 1)].sum(axis=1, dtype=np.int64)
+
+    def subsets(self, keys: np.ndarray) -> np.ndarray:
+        """ids of proper subsets of keys of the same order, by `subset_columns`"""
+        keys = np.asarray(keys, dtype=np.int64).reshape(len(keys), -1)
+        table = [self.rank(keys[:, list(columns)])
+                 for columns in subset_columns(keys.shape[1])]
+        return np.column_stack(table) if table else np.zeros((len(keys), 0), dtype=np.int64)
+
+
+class EpiTable:
+    """
+    epistasis of residue keys by key id, the position of a key in `keys`,
+    combinations of a key are rows of codes, and a key is substituted
+    lower-order contribution as soon as it is solved and all of its
+    subsets, which should be in `keys`, are substituted
+    """
 
-    max_order: int
-        maximum input for combinations
+    def __init__(self, keys: List[MultiResidue], index: KeyIndex, variable_num: int) -> None:
+        self.keys = keys
+        self.key_id = {key: i for i, key in enumerate(keys)}
+        self.order = np.array([len(key) for key in keys], dtype=np.int64)
+        assert variable_num ** max(self.order.tolist(), default=0) < 2 ** 63, \
+            "too many combinations for integer ids"
+        self.variable_num = variable_num
+
+        ranks = np.zeros(len(keys), dtype=np.int64)
+        # key ids of subsets of every key, by `subset_columns` of its order
+        self.subset_ids: List[np.ndarray] = [np.zeros(0, dtype=np.int64)] * len(keys)
+        tables = []
+        for order in np.unique(self.order).tolist():
+            members = np.flatnonzero(self.order == order)
+            rows = np.array([keys[i] for i in members], dtype=np.int64)
+            ranks[members] = index.rank(rows)
+            tables.append((members, index.subsets(rows)))
+        by_rank = np.argsort(ranks)
+        for members, subsets in tables:
+            at = np.searchsorted(ranks[by_rank], subsets).clip(max=len(keys) - 1)
+            assert (ranks[by_rank][at] == subsets).all(), "subset of a key is missing"
+            for member, ids in zip(members.tolist(), by_rank[at]):
+                self.subset_ids[member] = ids
+
+        # supersets of every key, those of key `u` are `superset[indptr[u]:indptr[u + 1]]`
+        subset = np.concatenate([np.zeros(0, dtype=np.int64)] + self.subset_ids)
+        owner = np.repeat(np.arange(len(keys)), [len(ids) for ids in self.subset_ids])
+        self.superset = owner[np.argsort(subset, kind="stable")]
+        self.indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(subset, minlength=len(keys)), out=self.indptr[1:])
+
+        # subsets not yet substituted of every key
+        self.missing = np.array([len(ids) for ids in self.subset_ids], dtype=np.int64)
+        self.solved = np.zeros(len(keys), dtype=bool)
+        self.done = np.zeros(len(keys), dtype=bool)
+        self.codes: List[Optional[np.ndarray]] = [None] * len(keys)
+        self.values: List[Optional[np.ndarray]] = [None] * len(keys)
+        self.connected: List[Optional[np.ndarray]] = [None] * len(keys)
+        # combination ids of substituted keys, sorted as their codes
+        self.ids: List[Optional[np.ndarray]] = [None] * len(keys)
+
+    def code_ids(self, codes: np.ndarray) -> np.ndarray:
+        """number combinations by their codes, in lexicographic order of codes"""
+        weight = self.variable_num ** np.arange(codes.shape[1] - 1, -1, -1, dtype=np.int64)
+        return codes.astype(np.int64) @ weight
+
+    def put(
+        self, key_id: int, codes: np.ndarray, values: np.ndarray,
+        connected: Optional[np.ndarray] = None,
+    ) -> List[int]:
+        """
+        store a solved key, with codes of its combinations in lexicographic
+        order, substitute it and every key which becomes ready, every
+        combination is kept for substitution of supersets, but only
+        `connected` ones, which have any neighbour, are reported
+
+        Returns
+        -------
+        substituted : List[int]
+            ids of substituted keys
+        """
+        self.codes[key_id] = codes
+        self.values[key_id] = np.array(values, dtype=np.float64)
+        self.connected[key_id] = (np.ones(len(codes), dtype=bool)
+                                  if connected is None else connected)
+        self.solved[key_id] = True
+        substituted = []
+        ready = [key_id]
+        while ready:
+            key = ready.pop()
+            if self.done[key] or not self.solved[key] or self.missing[key] > 0:
+                continue
+            self.substitute(key)
+            substituted.append(key)
+            supersets = self.superset[self.indptr[key]:self.indptr[key + 1]]
+            self.missing[supersets] -= 1
+            ready.extend(supersets[(self.missing[supersets] == 0)
+                                   & self.solved[supersets]].tolist())
+        return substituted
+
+    def substitute(self, key_id: int) -> None:
+        """substitute lower-order contribution of every subset of a key"""
+        codes, values = self.codes[key_id], self.values[key_id]
+        for columns, lower in zip(subset_columns(int(self.order[key_id])),
+                                  self.subset_ids[key_id].tolist()):
+            at = np.searchsorted(self.ids[lower], self.code_ids(codes[:, list(columns)]))
+            values -= self.values[lower][at]
+        self.ids[key_id] = self.code_ids(codes)
+        self.done[key_id] = True
+
+    def epistasis(self, key_id: int, dictionary: Dictionary) -> EpiResidue:
+        """epistasis of every connected combination of a substituted key"""
+        connected = self.connected[key_id]
+        possiable_keys = [dictionary.decode(codes)
+                          for codes in self.codes[key_id][connected]]
+        return dict(zip(possiable_keys, self.values[key_id][connected].tolist()))
+
+
+def connected_label(
+    node_num: int, source: np.ndarray, target: np.ndarray
+) -> np.ndarray:
+    """
+    label nodes by their connected component with union-find,
+    by hooking roots to the smaller one and jumping pointers
 
     Returns
     -------
-    comb : List[MultiResidue]
-        result of combinations
+    label : np.ndarray
+        smallest node of the component of every node
 
     Examples
     --------
-    >> assert(mk_combine(3, 2) == [(0, ), (1, ), (2, ), (0, 1), (0, 2), (1, 2)])
+    >> assert(connected_label(4, np.array([3]), np.array([1])).tolist() == [0, 1, 2, 1])
     """
-    ret: List[MultiResidue] = []
-    for order in range(1, max_order + 1):
-        once: List[MultiResidue] = list(
-            combinations(list(range(num)), order))
-        ret.extend(once)
-    return ret
-
-
-def mk_combine_with_k(
-    k: MultiResidue, num: int, max_order: int
-) -> List[MultiResidue]:
+    label = np.arange(node_num)
+    while True:
+        lower = np.minimum(label[source], label[target])
+        hooked = label.copy()
+        for end in (source, target, label[source], label[target]):
+            np.minimum.at(hooked, end, lower)
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, label):
+            return label
+        label = hooked
+
+
+def bfs_potential(
+    node_num: int, source: np.ndarray, target: np.ndarray, delta: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    connect the combination of (1, 2, ...,n) from order 1 to max_order, which must contains k.
+    calaulate potential of nodes from potential delta of edges,
+    along a breadth-first spanning tree from the smallest node of every
+    component, and centre potential of every component to mean of zero
 
     Parameters
     ----------
-    k: int
-        must contain element
+    node_num: int
+        number of nodes
 
-    n: int
-        input elements range
-
-    max_order: int
-        maximum input for combinations
+    source, target, delta: np.ndarray
+        `potential[target] - potential[source] = delta` of every edge,
+        when both directions of an edge are given the first one decides
+        the order of visiting and each direction keeps its own delta,
+        a row of K deltas for K potentials along the same tree
 
     Returns
     -------
-    comb : List[MultiResidue]
-        result of combinations
+    potential, label : Tuple[np.ndarray, np.ndarray]
+        potential and component label of every node
+    """
+    label = connected_label(node_num, source, target)
+
+    # adjacency of both directions, neighbours in order of first appearance
+    appear = np.arange(len(source))
+    src = np.concatenate([source, target])
+    tgt = np.concatenate([target, source])
+    value = np.concatenate([delta, -delta])
+    reverse = np.repeat([0, 1], len(source))
+    appear = np.concatenate([appear, appear])
+    order = np.lexsort((reverse, tgt, src))
+    src, tgt, value, appear = src[order], tgt[order], value[order], appear[order]
+    first = np.ones(len(src), dtype=bool)
+    first[1:] = (src[1:] != src[:-1]) | (tgt[1:] != tgt[:-1])
+    first = np.flatnonzero(first)
+    if len(first) > 0:
+        appear = np.minimum.reduceat(appear, first)
+    src, tgt, value = src[first], tgt[first], value[first]
+    order = np.lexsort((appear, src))
+    src, tgt, value = src[order], tgt[order], value[order]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=node_num))])
+
+    potential = np.zeros((node_num,) + delta.shape[1:])
+    visited = label == np.arange(node_num)
+    frontier = np.flatnonzero(visited)
+    while len(frontier) > 0:
+        degree = indptr[frontier + 1] - indptr[frontier]
+        edges = np.repeat(indptr[frontier], degree) + (
+            np.arange(degree.sum()) - np.repeat(np.cumsum(degree) - degree, degree))
+        edges = edges[~visited[tgt[edges]]]
+        # a node is reached from the first queued node linking to it
+        _, reach = np.unique(tgt[edges], return_index=True)
+        edges = edges[np.sort(reach)]
+        potential[tgt[edges]] = potential[src[edges]] + value[edges]
+        visited[tgt[edges]] = True
+        frontier = tgt[edges]
+
+    return centre_potential(potential, label), label
+
+
+def centre_potential(potential: np.ndarray, label: np.ndarray) -> np.ndarray:
+    """centre potential of every component to mean of zero"""
+    count = np.bincount(label, minlength=len(label))
+    total = group_sum(label, potential, len(label))
+    # an empty component sums to zero
+    mean = (total.T / np.maximum(count, 1)).T
+    return potential - mean[label]
+
+
+def lsq_potential(
+    node_num: int, source: np.ndarray, target: np.ndarray, delta: np.ndarray,
+    tol: float = 1e-10, maxiter: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    calaulate potential of nodes from potential delta of edges by least
+    squares, which uses every edge rather than a spanning tree, and centre
+    potential of every component to mean of zero
 
-    Examples
-    --------
-    >> assert(mk_combine(3, 2) == [(0, ), (1, ), (2, ), (0, 1), (0, 2), (1, 2)])
-    """
-    k_set = set(k)
-    ret: List[MultiResidue] = []
-    for order in range(0, max_order):
-        other: List[List[int]] = [
-            list(res)
-            for res in combinations([j for j in range(num) if j not in k_set], order)
-        ]
-        for res in other:
-            for add in k:
-                insort(res, add)
-        once: List[MultiResidue] = [tuple(res) for res in other]
-        ret.extend(once)
-    return ret
+    The normal equation is the graph Laplacian, solved by conjugate
+    gradient with Jacobi preconditioner, every component of the graph
+    is fixed afterwards by centring.
 
+    Parameters
+    ----------
+    node_num: int
+        number of nodes
+
+    source, target, delta: np.ndarray
+        `potential[target] - potential[source] = delta` of every edge,
+        a row of K deltas for K systems of the same Laplacian, solved
+        together by column
+
+    tol: float
+        relative tolerance of residual of every column
 
+    maxiter: int
+        maximum iterations, 0 for `node_num`
+
+    Returns
+    -------
+    potential, label : Tuple[np.ndarray, np.ndarray]
+        potential and component label of every node
+    """
+    label = connected_label(node_num, source, target)
+    # node weights broadcast over columns of K systems
+    shape = (node_num,) + (1,) * (delta.ndim - 1)
+    degree = (np.bincount(source, minlength=node_num)
+              + np.bincount(target, minlength=node_num)).astype(np.float64)
+    inverse = np.divide(1, degree, out=np.zeros(node_num), where=degree > 0).reshape(shape)
+    degree = degree.reshape(shape)
+
+    def laplacian(vector: np.ndarray) -> np.ndarray:
+        return degree * vector - (group_sum(source, vector[target], node_num)
+                                  + group_sum(target, vector[source], node_num))
+
+    def ratio(top: np.ndarray, bottom: np.ndarray) -> np.ndarray:
+        # a converged column stops moving instead of dividing by zero
+        return np.divide(top, bottom, out=np.zeros_like(top), where=bottom > 0)
+
+    rhs = group_sum(target, delta, node_num) - group_sum(source, delta, node_num)
+    potential = np.zeros_like(rhs)
+    residual = rhs.copy()
+    precond = inverse * residual
+    direction = precond.copy()
+    inner = (residual * precond).sum(axis=0)
+    bound = tol * np.sqrt((rhs ** 2).sum(axis=0))
+    for _ in range(maxiter or max(node_num, 1)):
+        if (np.sqrt((residual ** 2).sum(axis=0)) <= bound).all():
+            break
+        product = laplacian(direction)
+        step = ratio(inner, (direction * product).sum(axis=0))
+        potential += step * direction
+        residual -= step * product
+        precond = inverse * residual
+        inner, last = (residual * precond).sum(axis=0), inner
+        direction = precond + ratio(inner, last) * direction
+    return centre_potential(potential, label), label
+
+
+@metrics.staged("epi_from_diff")
 def get_epi_from_diff(
     diff: Dict[SeqDiff, float], possiable_keys: List[Seq],
 ) -> EpiResidue:
@@ -161,58 +438,9 @@ def get_epi_from_diff(
     epi_values : EpiResidue
         averaging epistasis value of all variance combination in each residue
     """
-    graph = nx.Graph()
     keys_index = {key: i for i, key in enumerate(possiable_keys)}
-    epi_values = {key: 0.0 for key in possiable_keys}
-
-    graph.add_edges_from(
-        [(keys_index[diff[0]], keys_index[diff[1]]) for diff in list(diff.keys())])
-    rings: Generator[Set[int], None, None] = nx.connected_components(graph)
-
-    for ring in rings:
-        edges = list(nx.bfs_edges(graph.subgraph(ring), 0))
-        for edge in edges:
-            edge = cast(Tuple[int, int], edge)
-            src_seq, tgt_seq = possiable_keys[edge[0]], possiable_keys[edge[1]]
-            # one of (src_seq, tgt_seq) / (tgt_seq, src_seq) must in diff
-            delta = (
-                diff[(src_seq, tgt_seq)]
-                if (src_seq, tgt_seq) in diff
-                else -diff[(tgt_seq, src_seq)]
-            )
-            epi_values[tgt_seq] = epi_values[src_seq] + delta
-        select_values = [epi_values[possiable_keys[v]] for v in ring]
-        value_mean = sum(select_values) / len(select_values)
-        for point in ring:
-            epi_values[possiable_keys[point]] -= value_mean
-    return epi_values
-
-
-def fetch_lower_select(
-    lower_multi_res: MultiResidue, sorted_at_key: MultiResidue
-) -> MultiResidue:
-    """
-    pick lower_multi_res by sequence of sorted_at_key
-
-    Parameters
-    ----------
-    lower_multi_res: MultiResidue
-        pick source of residues
-
-    sorted_at_key: MultiResidue
-        key to be sorted and fetch index
-
-    Returns
-    -------
-    epi_values : EpiResidue
-        averaging epistasis value of all variance combination in each residue
-    """
-    index = argsort(sorted_at_key)
-    res_to_ind = dict(zip(sorted_at_key, index))
-    return tuple(res_to_ind[i] for i in lower_multi_res)
-
-
-def argsort(seq):
-    """sort and return index"""
-    # http://stackoverflow.com/questions/3071415/efficient-method-to-calculate-the-rank-vector-of-a-list-in-python
-    return sorted(range(len(seq)), key=seq.__getitem__)
+    source = np.array([keys_index[src] for src, _ in diff], dtype=np.intp)
+    target = np.array([keys_index[tgt] for _, tgt in diff], dtype=np.intp)
+    delta = np.fromiter(diff.values(), dtype=np.float64, count=len(diff))
+    potential, _ = bfs_potential(len(possiable_keys), source, target, delta)
+    return dict(zip(possiable_keys, potential.tolist()))
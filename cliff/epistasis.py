@@ -1,30 +1,34 @@
 """Cauculation of dataset Epistasis"""
 from functools import cmp_to_key
-from itertools import combinations, product, zip_longest
+from itertools import zip_longest
 import logging
 import sys
-from typing import Union, Set, Tuple, Dict, List
+from typing import (TYPE_CHECKING, Callable, Iterator, Optional, Sequence,
+                    Union, Set, Tuple, Dict, List)
 
-from matplotlib import colors, gridspec
-from matplotlib import pyplot as plt
-from matplotlib.figure import Figure
 import numpy as np
-from joblib import Parallel, delayed
 
-from cliff.metadata import MetaData, NeighbourItem
+from cliff import metrics
+from cliff.metadata import UNKNOWN, Dictionary, MetaData, NeighbourGraph, group_sum
+from cliff.cache import NeighbourCache
 from cliff.parser.base import Scenery
-from cliff.epi_utils import (select_substr,
-                             mk_combine_subset,
-                             mk_combine,
-                             mk_combine_with_k,
-                             get_epi_from_diff,
-                             fetch_lower_select,
+from cliff.progress import Progress, as_progress
+from cliff.schedule import Scheduler
+from cliff.epi_utils import (EpiLink,
+                             EpiTable,
+                             KeyIndex,
+                             KeySupport,
+                             grow_keys,
+                             bfs_potential,
+                             lsq_potential,
                              MultiResidue,
                              EpiResidue,
                              EpiNet,
-                             SeqDiff,
                              Seq)
 
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
 
 logging.basicConfig(level=logging.INFO)
 
@@ -32,7 +36,7 @@ LARGE = sys.float_info.max
 
 
 class Epi2Show:
-    """module for plot Epistasis"""
+    """module for plot Epistasis, matplotlib is imported on first use"""
 
     @staticmethod
     def sort_key(one: Tuple[int], two: Tuple[int]):
@@ -44,6 +48,11 @@ class Epi2Show:
 
     def __init__(self, varible: Tuple[str], possible_keys: Set[MultiResidue],
                  epi: Dict[MultiResidue, EpiResidue]):
+        # pylint: disable=import-outside-toplevel
+        from matplotlib import colors, gridspec
+        from matplotlib import pyplot as plt
+
+        assert possible_keys, "no residue key to plot, every key is filtered out"
         self.max_keys_num = max(max(b) for b in possible_keys) + 1
         self.varibles = varible
         self.varibles_index = {key: i for i, key in enumerate(varible)}
@@ -93,7 +102,8 @@ class Epi2Show:
             tick.label1.set_visible(False)
             tick.label2.set_visible(False)
 
-    def plot(self) -> Figure:
+    @metrics.staged("plot")
+    def plot(self) -> "Figure":
         """draw a graph of Epistasis"""
         values = []
         for bases in self.possible_keys:
@@ -129,19 +139,167 @@ class Epi2Show:
         return self.fig
 
 
+SOLVERS = ("tree", "lsq")
+
+
+def select_column(
+    epi: Dict[MultiResidue, EpiResidue], column: int,
+) -> Dict[MultiResidue, EpiResidue]:
+    """epistasis of a fitness column, out of epistasis of N x K fitness"""
+    return {key: {seq: values[column] for seq, values in residue.items()}
+            for key, residue in epi.items()}
+
+
+def key_system(
+    sorted_at_key: MultiResidue,
+    matrix: np.ndarray,
+    fitness: np.ndarray,
+    epi_link: EpiLink,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    averaged fitness delta between combinations of a residue key
+
+    Returns
+    -------
+    nodes, source, target, delta : Tuple[np.ndarray, ...]
+        codes of every combination appeared in dataset, connected or not,
+        and `fitness[source] - fitness[target]` averaged by combination pair,
+        a row of K deltas for N x K fitness
+    """
+    index = list(sorted_at_key)
+    sources, targets = epi_link.select(sorted_at_key)
+    projection = np.ascontiguousarray(matrix[:, index])
+    # sequences with a residue of the key out of variables form no combination
+    known = (projection != UNKNOWN).all(axis=1)
+    edge_known = known[sources] & known[targets]
+    sources, targets = sources[edge_known], targets[edge_known]
+    nodes, known_node = np.unique(
+        projection[known].view(f"V{len(index)}").ravel(), return_inverse=True)
+    node_of_seq = np.full(len(matrix), -1, dtype=np.int64)
+    node_of_seq[known] = known_node.reshape(-1)
+    # group edges by (source, target) combination
+    pairs, pair_index = np.unique(
+        node_of_seq[sources] * len(nodes) + node_of_seq[targets],
+        return_inverse=True)
+    pair_num = np.bincount(pair_index, minlength=len(pairs))
+    pair_sum = group_sum(
+        pair_index, fitness[sources] - fitness[targets], len(pairs))
+    return (nodes.view(np.uint8).reshape(len(nodes), len(index)),
+            pairs // len(nodes), pairs % len(nodes), (pair_sum.T / pair_num).T)
+
+
+def cal_batch(
+    keys: List[MultiResidue],
+    matrix: np.ndarray,
+    fitness: np.ndarray,
+    epi_link: EpiLink,
+    solver: str = "tree",
+) -> List[Tuple[np.ndarray, np.ndarray, int, np.ndarray]]:
+    """
+    calculate Epistasis of several residue combinations,
+    only reads shared arrays so that it can run in any worker
+
+    `tree` solves every key along a spanning tree, `lsq` stacks all keys
+    into one least-squares system which uses every averaged delta
+
+    Returns
+    -------
+    results : List[Tuple[np.ndarray, np.ndarray, int, np.ndarray]]
+        codes of combinations in lexicographic order, their epistasis
+        before substitution, number of connected components and whether
+        a combination has any neighbour, by key
+    """
+    systems = [key_system(key, matrix, fitness, epi_link) for key in keys]
+    if solver == "tree":
+        solved = [bfs_potential(len(nodes), source, target, delta)
+                  for nodes, source, target, delta in systems]
+        potentials = [potential for potential, _ in solved]
+        labels = [label for _, label in solved]
+    else:
+        offsets = np.cumsum([0] + [len(system[0]) for system in systems])
+        potential, label = lsq_potential(
+            offsets[-1],
+            np.concatenate([system[1] + offset
+                            for system, offset in zip(systems, offsets)]),
+            np.concatenate([system[2] + offset
+                            for system, offset in zip(systems, offsets)]),
+            np.concatenate([system[3] for system in systems]),
+        )
+        potentials = np.split(potential, offsets[1:-1])
+        labels = np.split(label, offsets[1:-1])
+
+    return [(nodes, potential, len(np.unique(label)),
+             np.bincount(np.concatenate([source, target]), minlength=len(nodes)) > 0)
+            for (nodes, source, target, _), potential, label
+            in zip(systems, potentials, labels)]
+
+
+def cal_key(
+    sorted_at_key: MultiResidue,
+    matrix: np.ndarray,
+    fitness: np.ndarray,
+    epi_link: EpiLink,
+    dictionary: Dictionary,
+) -> Tuple[List[Seq], EpiResidue]:
+    """
+    calculate Epistasis of a residue combinations along a spanning tree,
+    of combinations which have any neighbour
+    """
+    nodes, potential, _, connected = cal_batch([sorted_at_key], matrix, fitness, epi_link)[0]
+    nodes, potential = nodes[connected], potential[connected]
+    possiable_keys = [dictionary.decode(codes) for codes in nodes]
+    return possiable_keys, dict(zip(possiable_keys, potential.tolist()))
+
+
 class Epistasis:
     """Cauculation of dataset Ruggness"""
 
     def __init__(
-        self, scenery: Scenery, max_order: int, variables: Union[List[str], str]
+        self,
+        scenery: Scenery,
+        max_order: int,
+        variables: Union[List[str], str],
+        n_jobs: int = -1,
+        batch_size: int = 0,
+        backend: str = "loky",
+        max_nbytes: Union[int, str, None] = "1M",
+        solver: str = "tree",
+        cache: Union[bool, NeighbourCache, None] = None,
+        progress: Union[bool, Progress] = False,
+        positions: Optional[Sequence[int]] = None,
+        groups: Optional[Sequence[Sequence[int]]] = None,
+        min_support: int = 0,
+        prune: Optional[Callable[[MultiResidue, int], bool]] = None,
     ) -> None:
 
         self.variables = variables
+        # keys are made of residues of `positions`, inside one of `groups`,
+        # supported by at least `min_support` sequences and not `prune`d by
+        # their residues and support, a key of higher order is only made
+        # if all of its subsets are kept, see `iter_keys`
+        self.positions = positions
+        self.groups = None if groups is None else [set(group) for group in groups]
+        self.min_support = min_support
+        self.prune = prune
+        self.support: Optional[KeySupport] = None
+        # neighbour search residue by residue, and keys of every order
+        # batch by batch as workers finish them, True for tqdm bars
+        self.progress = as_progress(progress)
+        # `tree` for spanning tree of every key, `lsq` for least squares of
+        # every batch, which holds all keys of an order of a worker by default
+        assert solver in SOLVERS, f"solver should be one of {SOLVERS}"
+        self.solver = solver
+        # residue keys are solved in batches by at most `n_jobs` workers,
+        # see `Scheduler` for the options
+        self.scheduler = Scheduler(
+            n_jobs, batch_size, backend, max_nbytes,
+            tasks_per_worker=4 if solver == "tree" else 1)
 
         self.scenery = scenery
-        self.sequence_length = len(scenery.sequence[0])
-        self.fitness = scenery.fitness
-        self.sequence = scenery.sequence
+        self.meta = MetaData(scenery, variables, cache)
+        self.sequence_length = self.meta.sequence_length
+        self.fitness = self.meta.fitness
+        self.matrix = self.meta.matrix
 
         assert 1 <= max_order <= self.sequence_length
         self.max_order = max_order
@@ -150,76 +308,137 @@ class Epistasis:
         self.epi_net: EpiNet = {}
         self.possible_keys: Set[MultiResidue] = set()
 
-    def to_draw(self, epi: Dict[MultiResidue, EpiResidue]) -> Epi2Show:
-        """plot Epistasis"""
+    def to_draw(self, epi: Dict[MultiResidue, EpiResidue],
+                column: Optional[int] = None) -> Epi2Show:
+        """plot Epistasis, of a fitness `column` for N x K fitness"""
+        assert column is not None or self.fitness.ndim == 1, \
+            "a fitness column should be chosen to plot N x K fitness"
+        if column is not None:
+            epi = select_column(epi, column)
         return Epi2Show(self.variables, self.possible_keys, epi)
 
-    def cal_epi_link(
-        self, target: NeighbourItem
-    ) -> Dict[MultiResidue, List[Tuple[int, NeighbourItem]]]:
-        """calculate neighbour of every residue combinations"""
-        epi_link: Dict[MultiResidue, List[Tuple[int, NeighbourItem]]] = {
-            key: [] for key in mk_combine(self.sequence_length, self.max_order)
-        }
-        for seq_i_index, nearbys in target.items():
-            for neighbour in nearbys:
-                epi_keys = mk_combine_with_k(
-                    neighbour.index, self.sequence_length, self.max_order
-                )
-                for key in epi_keys:
-                    epi_link[key].append((seq_i_index, neighbour))
-        return epi_link
+    @metrics.staged("epi_link")
+    def cal_epi_link(self, target: NeighbourGraph) -> EpiLink:
+        """calculate neighbour edges of every residue combinations"""
+        return EpiLink(target, self.sequence_length)
 
     def cal_order(
         self,
         sorted_at_key: MultiResidue,
         neighbour=None,
-    ) -> EpiResidue:
+    ) -> Tuple[List[Seq], EpiResidue]:
         """calculate Epistasis of a residue combinations"""
-        used_base = sorted_at_key
         if neighbour is None:
-            meta = MetaData(self.scenery, self.variables)
-            meta.get_neighbour(used_base, tqdm_enable=False)
-            neighbour = meta.neighbour
-        epi_link = self.cal_epi_link(neighbour)
-        diff_group: Dict[SeqDiff, List[float]] = {}
-        used_neighbours = epi_link[sorted_at_key]
-
-        for i, neighbor in used_neighbours:
-            src_key = select_substr(self.sequence[i], sorted_at_key)
-            tgt_key = select_substr(
-                self.sequence[neighbor.target], sorted_at_key)
-            diff_group.setdefault((src_key, tgt_key), []).append(
-                self.fitness[i] - self.fitness[neighbor.target]
-            )
-
-        diff_group = {key: value for key,
-                      value in diff_group.items() if len(value) > 0}
-        keys_set: Set[Seq] = set()
-        for key, _ in diff_group.items():
-            src, tgt = key
-            if src not in keys_set:
-                keys_set.add(src)
-            if tgt not in keys_set:
-                keys_set.add(tgt)
-
-        possiable_keys = list(keys_set)
-        diff = {key: sum(value) / len(value)
-                for key, value in diff_group.items()}
-
-        epi_values = get_epi_from_diff(diff, possiable_keys)
-
-        return possiable_keys, epi_values
-
-    def sub(self, epi_value: EpiResidue, possiable_keys: List[Seq],
-            sorted_at_key: MultiResidue):
-        """substitude lower-order contribution"""
-        lower_base_comb = mk_combine_subset(sorted_at_key)
-        for lower_base, seq in product(lower_base_comb, possiable_keys):
-            lower_index = fetch_lower_select(lower_base, sorted_at_key)
-            lower_seq = select_substr(seq, lower_index)
-            epi_value[seq] -= self.epi_net[lower_base][lower_seq]
-        self.epi_net[sorted_at_key] = epi_value
+            if len(self.meta.neighbour) == 0:
+                self.meta.get_neighbour(tqdm_enable=False)
+            neighbour = self.meta.neighbour
+        return cal_key(sorted_at_key, self.matrix, self.fitness,
+                       self.cal_epi_link(neighbour), self.meta.dictionary)
+
+    def residues(self) -> List[int]:
+        """residues which keys are made of"""
+        residues = set(self.meta.variable_positions.tolist())
+        if self.positions is not None:
+            residues &= set(self.positions)
+        if self.groups is not None:
+            residues &= set().union(*self.groups)
+        return sorted(residues)
+
+    def keep(self, sorted_at_key: MultiResidue) -> bool:
+        """whether a key is calculated, and keys of higher order made of it"""
+        if self.groups is not None and not any(
+                set(sorted_at_key) <= group for group in self.groups):
+            return False
+        if self.support is None:
+            return True
+        support = self.support.count(sorted_at_key)
+        kept = support >= self.min_support and (
+            self.prune is None or not self.prune(sorted_at_key, support))
+        if not kept:
+            metrics.count("epistasis.pruned")
+        return kept
+
+    def iter_keys(self) -> Iterator[Tuple[int, List[MultiResidue]]]:
+        """
+        generate kept keys order by order, a key of higher order is only
+        made of kept keys of lower order, so that keys over pruned keys are
+        never made, needs neighbours of `residues` for support
+
+        Yields
+        ------
+        order, keys : Tuple[int, List[MultiResidue]]
+            order and its kept keys in lexicographic order
+        """
+        keys: List[MultiResidue] = [(res,) for res in self.residues()]
+        for order in range(1, self.max_order + 1):
+            if order > 1:
+                keys = list(grow_keys(keys))
+            keys = [key for key in keys if self.keep(key)]
+            yield order, keys
+
+    def iter_orders(self) -> Iterator[Tuple[int, Dict[MultiResidue, EpiResidue]]]:
+        """
+        calculate epistasis of a scenery order by order,
+        a key is substituded as soon as it and its lower-order subsets
+        are solved, and an order is yielded as soon as it is finished
+
+        Yields
+        ------
+        order, epistasis : Tuple[int, Dict[MultiResidue, EpiResidue]]
+            order and epistasis of its residue combinations
+        """
+        # neighbours are built once, arrays of them are memory-mapped
+        # into workers by the scheduler instead of being pickled per task
+        residues = self.residues()
+        if len(self.meta.neighbour) == 0:
+            self.meta.get_neighbour([(res,) for res in residues],
+                                    progress=self.progress)
+        if self.min_support > 0 or self.prune is not None:
+            self.support = KeySupport(self.meta.neighbour, residues)
+        order_keys: Dict[int, List[MultiResidue]] = dict(self.iter_keys())
+        epi_order_keys = [key for keys in order_keys.values() for key in keys]
+        self.possible_keys.update(epi_order_keys)
+
+        # keys are numbered by the combinatorial number system, so that
+        # lower-order subsets of a key are integer ids instead of tuples
+        table = EpiTable(epi_order_keys, KeyIndex(residues, self.max_order),
+                         int(self.matrix.max(initial=0)) + 1)
+
+        epi_link = self.cal_epi_link(self.meta.neighbour)
+        for order, keys in order_keys.items():
+            self.progress.start(f"epistasis order {order}", len(keys))
+        results = self.scheduler.imap_unordered(
+            cal_batch, epi_order_keys,
+            self.matrix, self.fitness, epi_link, self.solver,
+            group=len, per_batch=True,
+            done=lambda batch: self.progress.advance(
+                f"epistasis order {len(batch[0])}", len(batch)))
+
+        remain = {i: len(keys) for i, keys in order_keys.items()}
+        next_order = 1
+        while True:
+            # finished orders, or orders without any key, are yielded first
+            while next_order <= self.max_order and remain[next_order] == 0:
+                self.progress.finish(f"epistasis order {next_order}")
+                for key in order_keys[next_order]:
+                    self.epi_net[key] = table.epistasis(
+                        table.key_id[key], self.meta.dictionary)
+                yield next_order, {key: self.epi_net[key]
+                                   for key in order_keys[next_order]}
+                next_order += 1
+            # waiting for workers, stages are never held over a yield
+            with metrics.stage("solve"):
+                result = next(results, None)
+            if result is None:
+                break
+            sorted_at_key, (codes, potential, components, connected) = result
+            metrics.count("epistasis.keys")
+            metrics.count("epistasis.combinations", int(connected.sum()))
+            metrics.count("epistasis.components", components)
+            with metrics.stage("substitute"):
+                for key_id in table.put(table.key_id[sorted_at_key], codes, potential,
+                                        connected):
+                    remain[int(table.order[key_id])] -= 1
 
     def calculate(self) -> Dict[MultiResidue, EpiResidue]:
         """
@@ -228,17 +447,9 @@ class Epistasis:
         Returns
         -------
         epistasis : Dict[MultiResidue, EpiResidue]
-            epistasis of scenery
+            epistasis of scenery, a list of K values of every combination
+            for N x K fitness, see `select_column`
         """
-        epi_order_keys: List[MultiResidue] = []
-        for i in range(1, self.max_order + 1):
-            epi_order_keys.extend(
-                list(combinations(range(self.sequence_length), i)))
-            if i < self.max_order + 1:
-                self.possible_keys.update(set(epi_order_keys))
-        all_ans = Parallel(n_jobs=len(epi_order_keys))(delayed(self.cal_order)(
-            sorted_at_key) for sorted_at_key in epi_order_keys)
-
-        for (possiable_keys, epi_value), sorted_at_key in zip(all_ans, epi_order_keys):
-            self.sub(epi_value, possiable_keys, sorted_at_key)
+        for _ in self.iter_orders():
+            pass
         return self.epi_net
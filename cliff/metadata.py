@@ -1,15 +1,21 @@
 """metadata contains data struct of mutation dataset"""
 from __future__ import annotations
-from itertools import product
-from typing import cast, Union, Tuple, List, Dict, Set
+from typing import Iterator, Optional, Sequence, Union, Tuple, List, Dict, Set
 
-from tqdm import tqdm
+import numpy as np
 
+from cliff.cache import NeighbourCache, fingerprint
+from cliff import metrics
 from cliff.parser.base import Scenery
+from cliff.parser.bin_parser import BinParser
+from cliff.progress import NO_PROGRESS, Progress, as_progress
 
 MultiResidue = Tuple[int]
 Seq = Tuple[str]
 
+# code of a character which is not in the alphabet
+UNKNOWN = 255
+
 
 class NeighbourItem:
     """a `NeighbourItem` means the difference of two Neighboring sequences"""
@@ -21,139 +27,830 @@ class NeighbourItem:
     index: MultiResidue
 
 
+class NeighbourGraph:
+    """
+    compressed sparse row store of neighbours,
+    edges of sequence `i` are `indptr[i]:indptr[i + 1]`
+    """
+
+    def __init__(
+        self,
+        indptr: np.ndarray,
+        target: np.ndarray,
+        position: np.ndarray,
+        from_code: np.ndarray,
+        to_code: np.ndarray,
+        alphabet: str,
+    ) -> None:
+        self.indptr = indptr
+        self.target = target
+        # mutated residue, from `from_code` of source to `to_code` of target
+        self.position = position
+        self.from_code = from_code
+        self.to_code = to_code
+        self.alphabet = alphabet
+
+    @classmethod
+    def from_edges(
+        cls,
+        sequence_num: int,
+        source: np.ndarray,
+        target: np.ndarray,
+        position: np.ndarray,
+        from_code: np.ndarray,
+        to_code: np.ndarray,
+        alphabet: str,
+    ) -> NeighbourGraph:
+        """make a graph from unsorted edges"""
+        order = np.argsort(source, kind="stable")
+        indptr = np.zeros(sequence_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=sequence_num),
+                  out=indptr[1:])
+        return cls(
+            indptr,
+            target[order].astype(np.int32),
+            position[order].astype(np.int32),
+            from_code[order].astype(np.uint8),
+            to_code[order].astype(np.uint8),
+            alphabet,
+        )
+
+    @classmethod
+    def empty(cls, alphabet: str) -> NeighbourGraph:
+        """make a graph without sequence"""
+        edges = np.zeros(0, dtype=np.int64)
+        return cls.from_edges(0, edges, edges, edges, edges, edges, alphabet)
+
+    def insert(
+        self,
+        sequence_num: int,
+        sequence_length: int,
+        source: np.ndarray,
+        target: np.ndarray,
+        position: np.ndarray,
+        from_code: np.ndarray,
+        to_code: np.ndarray,
+    ) -> NeighbourGraph:
+        """
+        make a graph of `sequence_num` sequences with more edges, merged
+        into edges of every sequence in order of position and target,
+        the order of a graph built at once
+        """
+        assert sequence_num ** 2 * max(sequence_length, 1) < 2 ** 63, \
+            "too many sequences to order edges"
+        count = np.zeros(sequence_num, dtype=np.int64)
+        count[:len(self)] = np.diff(self.indptr)
+        count += np.bincount(source, minlength=sequence_num)
+        indptr = np.zeros(sequence_num + 1, dtype=np.int64)
+        np.cumsum(count, out=indptr[1:])
+
+        def edge_key(src: np.ndarray, pos: np.ndarray, tgt: np.ndarray) -> np.ndarray:
+            return (src.astype(np.int64) * sequence_length + pos) * sequence_num + tgt
+
+        order = np.argsort(edge_key(source, position, target), kind="stable")
+        at = np.searchsorted(edge_key(self.source, self.position, self.target),
+                             edge_key(source, position, target)[order])
+        return NeighbourGraph(
+            indptr,
+            *(np.insert(old, at, new[order].astype(old.dtype)) for old, new in (
+                (self.target, target), (self.position, position),
+                (self.from_code, from_code), (self.to_code, to_code))),
+            self.alphabet,
+        )
+
+    def select(self, keep: np.ndarray) -> NeighbourGraph:
+        """graph of kept sequences, renumbered in their order"""
+        index = np.cumsum(keep) - 1
+        source = self.source
+        edges = keep[source] & keep[self.target]
+        indptr = np.zeros(int(keep.sum()) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(index[source[edges]], minlength=len(indptr) - 1),
+                  out=indptr[1:])
+        return NeighbourGraph(
+            indptr, index[self.target[edges]].astype(np.int32),
+            self.position[edges], self.from_code[edges], self.to_code[edges],
+            self.alphabet)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """arrays of the graph by name"""
+        return {name: getattr(self, name) for name in
+                ("indptr", "target", "position", "from_code", "to_code")}
+
+    @property
+    def source(self) -> np.ndarray:
+        """source sequence of every edge"""
+        return np.repeat(
+            np.arange(len(self), dtype=np.int32), np.diff(self.indptr))
+
+    @property
+    def edge_num(self) -> int:
+        """number of directed edges"""
+        return len(self.target)
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def __getitem__(self, seq_index: int) -> Tuple[NeighbourItem]:
+        items = []
+        for edge in range(self.indptr[seq_index], self.indptr[seq_index + 1]):
+            item = NeighbourItem()
+            item.target = int(self.target[edge])
+            item.diff = (f"{self.alphabet[self.from_code[edge]]}"
+                         f"{self.alphabet[self.to_code[edge]]}")
+            item.index = (int(self.position[edge]),)
+            items.append(item)
+        return tuple(items)
+
+    def items(self) -> Iterator[Tuple[int, Tuple[NeighbourItem]]]:
+        """iterate neighbours of every sequence"""
+        for seq_index in range(len(self)):
+            yield seq_index, self[seq_index]
+
+
 class Neighbourhood:
     """`Neighbourhood` means the adjacency list of sequences"""
 
     def __init__(
         self,
-        use_residues: Tuple[MultiResidue],
-        sequence: List[str],
-        variables: Set[str],
-        tqdm_enable: bool,
+        positions: Sequence[int],
+        matrix: np.ndarray,
+        alphabet: str,
+        progress: Progress = NO_PROGRESS,
     ) -> None:
-        self.sequence: List[str] = sequence
-        self.tqdm_enable = tqdm_enable
+        self.matrix: np.ndarray = matrix
+        self.alphabet = alphabet
+        # advanced residue by residue
+        self.progress = progress
+        self.positions = positions
 
         # inferred attributes
-        self.sequence_length: int = len(sequence[0])
-        self.sequence_num: int = len(self.sequence)
-        self.seq_to_index: Dict[str, int] = {
-            seq: index for index, seq in enumerate(sequence)
-        }
-        self.res_variables: Dict[MultiResidue, Tuple[Seq]] = {
-            res: tuple(product(variables, repeat=2)) for res in use_residues
-        }
-        # used for inner calculation
-        # [((0, 1), (A, B)), (2, A)]
-        self.substitude_tuple: List[Tuple[MultiResidue, Seq]] = []
-        for res in use_residues:
-            self.substitude_tuple.extend(
-                [(res, seq) for seq in self.res_variables[res]]
-            )
-
-    @staticmethod
-    def substitude(target: str, index: MultiResidue, sub: Seq) -> str:
-        """generate a mutation of a sequence"""
-        ret = []
-        last = 0
-        for i, res in enumerate(index):
-            ret.append(target[last:res])
-            last = len(target) if i == len(index) - 1 else index[i + 1]
-            ret.append(sub[i])
-            ret.append(target[res + 1: last])
-        return "".join(ret)
-
-    @staticmethod
-    def select(target: str, index: MultiResidue) -> str:
-        """select some part of a str"""
-        return "".join([target[i] for i in index])
-
-    def prefetch_neighbour(self) -> Dict[int, Tuple[NeighbourItem]]:
+        self.sequence_num, self.sequence_length = matrix.shape
+
+    def mask(self, position: int) -> np.ndarray:
+        """
+        group sequences by their key with `position` masked out,
+        sequences of the same group differ only at `position`
+        """
+        masked = self.matrix.copy()
+        masked[:, position] = UNKNOWN
+        _, group = np.unique(
+            masked.view(f"V{self.sequence_length}").ravel(),
+            return_inverse=True)
+        return group.reshape(-1)
+
+    def prefetch_neighbour(self) -> NeighbourGraph:
         """calculate and store the neighbour"""
-        neighbour: Dict[int, List[NeighbourItem]] = {
-            i: [] for i in range(self.sequence_num)
-        }
-        merge_iter = product(range(self.sequence_num), self.substitude_tuple)
-        if self.tqdm_enable:
-            merge_iter = tqdm(
-                merge_iter,
-                desc="creating neighbour",
-                total=self.sequence_num * len(self.substitude_tuple),
-            )
-        for seq_index, (sub_index, sub_char) in merge_iter:
-            seq_index, sub_index, sub_char = cast(
-                Tuple[int, MultiResidue,
-                      Seq], (seq_index, sub_index, sub_char),
-            )
-            new_seq = self.substitude(
-                self.sequence[seq_index], sub_index, sub_char)
-            if new_seq not in self.seq_to_index:
-                continue
-            item = NeighbourItem()
-            item.target = self.seq_to_index[new_seq]
+        edges: List[Tuple[np.ndarray, ...]] = []
+        metrics.count("neighbour.candidates", self.sequence_num * len(self.positions))
+        self.progress.start("creating neighbour", len(self.positions))
+        for position in self.positions:
+            sources, targets = group_pairs(self.mask(position))
+            sources, targets = known_pairs(
+                sources, targets, self.matrix[sources, position], self.matrix[targets, position])
+            edges.append((
+                sources,
+                targets,
+                np.full(len(sources), position),
+                self.matrix[sources, position],
+                self.matrix[targets, position],
+            ))
+            self.progress.advance("creating neighbour")
+        self.progress.finish("creating neighbour")
+        if len(edges) == 0:
+            none = np.zeros(0, dtype=np.int64)
+            edges.append((none,) * 5)
+        return NeighbourGraph.from_edges(
+            self.sequence_num,
+            *(np.concatenate(column) for column in zip(*edges)),
+            self.alphabet,
+        )
+
+    def get(self) -> NeighbourGraph:
+        """store and return the neighbour"""
+        neighbour = self.prefetch_neighbour()
+        return neighbour
+
+
+class MutationSet:
+    """
+    compressed sparse row store of substitutions against a wild-type,
+    mutations of sequence `i` are `indptr[i]:indptr[i + 1]`, by position
+    """
+
+    def __init__(
+        self,
+        indptr: np.ndarray,
+        position: np.ndarray,
+        code: np.ndarray,
+        wild_code: np.ndarray,
+    ) -> None:
+        self.indptr = indptr
+        self.position = position
+        self.code = code
+        # code of wild-type at every position, `UNKNOWN` out of alphabet
+        self.wild_code = wild_code
+
+    @classmethod
+    def from_mutations(
+        cls, sequence_num: int, row: np.ndarray, position: np.ndarray,
+        code: np.ndarray, wild_code: np.ndarray,
+    ) -> MutationSet:
+        """collect substitutions of every sequence, sorted by row and position"""
+        indptr = np.zeros(sequence_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row, minlength=sequence_num), out=indptr[1:])
+        return cls(indptr, position.astype(np.int32), code.astype(np.uint8), wild_code)
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, wild_code: np.ndarray) -> MutationSet:
+        """collect residues of every sequence which differ from wild-type"""
+        row, position = np.nonzero(matrix != wild_code)
+        indptr = np.zeros(len(matrix) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row, minlength=len(matrix)), out=indptr[1:])
+        return cls(indptr, position.astype(np.int32),
+                   matrix[row, position], wild_code)
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def extend(self, other: MutationSet) -> MutationSet:
+        """mutations of sequences of both sets, those of `other` after"""
+        return MutationSet(
+            np.concatenate([self.indptr, self.indptr[-1] + other.indptr[1:]]),
+            np.concatenate([self.position, other.position]),
+            np.concatenate([self.code, other.code]), self.wild_code)
+
+    def select(self, keep: np.ndarray) -> MutationSet:
+        """mutations of kept sequences"""
+        count = np.diff(self.indptr)
+        rows = np.repeat(keep, count)
+        indptr = np.zeros(int(keep.sum()) + 1, dtype=np.int64)
+        np.cumsum(count[keep], out=indptr[1:])
+        return MutationSet(indptr, self.position[rows], self.code[rows], self.wild_code)
+
+    def variable_positions(self) -> np.ndarray:
+        """
+        residues which differ between sequences, mutated in some sequences
+        but not all, or to more than one code
+        """
+        position, count = np.unique(self.position, return_counts=True)
+        distinct = np.unique(self.position.astype(np.int64) * (UNKNOWN + 1) + self.code)
+        _, codes = np.unique(distinct // (UNKNOWN + 1), return_counts=True)
+        return position[(count < len(self)) | (codes > 1)].astype(np.int64)
+
+    def ids(self, variable_num: int) -> np.ndarray:
+        """number every mutation (index, to) by a dense integer"""
+        return self.position.astype(np.int64) * variable_num + self.code
+
+
+class MutationNeighbourhood:
+    """
+    `Neighbourhood` of a `MutationSet`, two sequences are neighbours if
+    their mutation sets are equal after removing one mutation of each,
+    or one mutation of either, at the same position
+
+    Sequences are grouped by "set minus one element" keys, so that the
+    cost grows with mutations per sequence instead of sequence length
+    """
+
+    def __init__(
+        self,
+        positions: Sequence[int],
+        mutation: MutationSet,
+        sequence_length: int,
+        alphabet: str,
+        progress: Progress = NO_PROGRESS,
+    ) -> None:
+        self.mutation = mutation
+        self.alphabet = alphabet
+        # advanced by sequences of the same number of mutations
+        self.progress = progress
+        self.positions = positions
+        self.sequence_length = sequence_length
+
+        # inferred attributes
+        self.sequence_num = len(mutation)
+
+    def rows(self, size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """sequences of `size` mutations and their mutation indices"""
+        count = np.diff(self.mutation.indptr)
+        seqs = np.flatnonzero(count == size)
+        return seqs, self.mutation.indptr[seqs][:, None] + np.arange(size)
+
+    def members(self, size: int) -> Tuple[np.ndarray, ...]:
+        """
+        group sequences of `size` mutations by their mutation set missing
+        one mutation, keyed by the rest and the position of the missing one,
+        the sequence of the rest, if any, joins the group with wild-type
+
+        Returns
+        -------
+        group, member, code, group_position : Tuple[np.ndarray, ...]
+            group, sequence and its code at the missing position of every
+            member, and the missing position of every group
+        """
+        mutation = self.mutation
+        ids = mutation.ids(len(self.alphabet))
+        seqs, at = self.rows(size)
+        lower_seqs, lower_at = self.rows(size - 1)
+        selected = np.zeros(self.sequence_length, dtype=bool)
+        selected[list(self.positions)] = True
 
-            diff_before = self.select(self.sequence[seq_index], sub_index)
-            diff_after = self.select(new_seq, sub_index)
-            item.diff = f"{diff_before}{diff_after}"
-            item.index = sub_index
+        rests, members, muts = [], [], []
+        for drop in range(size):
+            keep = selected[mutation.position[at[:, drop]]]
+            rests.append(ids[np.delete(at[keep], drop, axis=1)])
+            members.append(seqs[keep])
+            muts.append(at[keep, drop])
+        rest = np.concatenate(rests)
+        member = np.concatenate(members)
+        mut = np.concatenate(muts)
 
-            neighbour[seq_index].append(item)
-        return {key: tuple(value) for key, value in neighbour.items()}
+        group = unique_rows(
+            np.column_stack([rest, mutation.position[mut]]))
+        group_position = np.zeros(group.max(initial=-1) + 1, dtype=np.int32)
+        group_position[group] = mutation.position[mut]
 
-    def get(self) -> Dict[int, Tuple[NeighbourItem]]:
+        # sequences whose mutation set is one of `rest`
+        set_index = unique_rows(np.vstack([ids[lower_at], rest]))
+        owner = np.full(len(set_index), -1, dtype=np.int64)
+        owner[set_index[:len(lower_seqs)]] = lower_seqs
+        wild = owner[set_index[len(lower_seqs):]]
+        has_wild = wild >= 0
+        wild_group, wild = np.unique(
+            np.column_stack([group[has_wild], wild[has_wild]]),
+            axis=0).reshape(-1, 2).T
+
+        return (
+            np.concatenate([group, wild_group]),
+            np.concatenate([member, wild]),
+            np.concatenate([mutation.code[mut],
+                            mutation.wild_code[group_position[wild_group]]]),
+            group_position,
+        )
+
+    def prefetch_neighbour(self) -> NeighbourGraph:
+        """calculate and store the neighbour"""
+        edges: List[Tuple[np.ndarray, ...]] = []
+        sizes = range(1, int(np.diff(self.mutation.indptr).max(initial=0)) + 1)
+        self.progress.start("creating neighbour", len(sizes))
+        for size in sizes:
+            group, member, code, group_position = self.members(size)
+            metrics.count("neighbour.candidates", len(member))
+            sources, targets = group_pairs(group)
+            sources, targets = known_pairs(sources, targets, code[sources], code[targets])
+            edges.append((
+                member[sources],
+                member[targets],
+                group_position[group[sources]],
+                code[sources],
+                code[targets],
+            ))
+            self.progress.advance("creating neighbour")
+        self.progress.finish("creating neighbour")
+        if len(edges) == 0:
+            none = np.zeros(0, dtype=np.int64)
+            edges.append((none,) * 5)
+        source, target, position, from_code, to_code = (
+            np.concatenate(column) for column in zip(*edges))
+        # the same order of edges as `Neighbourhood`
+        order = np.lexsort((target, position, source))
+        return NeighbourGraph.from_edges(
+            self.sequence_num, source[order], target[order], position[order],
+            from_code[order], to_code[order], self.alphabet)
+
+    def get(self) -> NeighbourGraph:
         """store and return the neighbour"""
         neighbour = self.prefetch_neighbour()
         return neighbour
 
 
+def unique_rows(rows: np.ndarray) -> np.ndarray:
+    """
+    number rows of a 2d integer array, equal rows by the same number
+
+    Examples
+    --------
+    >> assert(unique_rows(np.array([[1, 2], [0, 1], [1, 2]])).tolist() == [1, 0, 1])
+    """
+    if rows.shape[1] == 0:
+        return np.zeros(len(rows), dtype=np.int64)
+    rows = np.ascontiguousarray(rows)
+    _, index = np.unique(
+        rows.view(f"V{rows.shape[1] * rows.itemsize}").ravel(),
+        return_inverse=True)
+    return index.reshape(-1)
+
+
+def group_sum(label: np.ndarray, value: np.ndarray, group_num: int) -> np.ndarray:
+    """
+    sum values by their group label, a row of K sums per group for
+    N x K values, in one `bincount` over all columns
+
+    Examples
+    --------
+    >> assert(group_sum(np.array([1, 0, 1]), np.ones((3, 2)), 2).tolist() == [[1, 1], [2, 2]])
+    """
+    if value.ndim == 1:
+        return np.bincount(label, weights=value, minlength=group_num)
+    columns = value.shape[1]
+    flat = (label.astype(np.int64)[:, None] * columns + np.arange(columns)).ravel()
+    return np.bincount(flat, weights=np.ascontiguousarray(value).ravel(),
+                       minlength=group_num * columns).reshape(group_num, columns)
+
+
+def group_pairs(group: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    list every ordered pair of different members inside each group
+
+    Parameters
+    ----------
+    group: np.ndarray
+        group id of every member
+
+    Returns
+    -------
+    pairs : Tuple[np.ndarray, np.ndarray]
+        source and target members of pairs, sorted by source
+
+    Examples
+    --------
+    >> assert([a.tolist() for a in group_pairs(np.array([0, 1, 0]))] == [[0, 2], [2, 0]])
+    """
+    sizes = np.bincount(group)
+    members = np.flatnonzero(sizes[group] > 1)
+    order = members[np.argsort(group[members], kind="stable")]
+    sorted_group = group[order]
+    size_each = sizes[sorted_group]
+    # begin of the group of each member, inside `order`
+    begin_each = np.searchsorted(sorted_group, sorted_group, side="left")
+    offset = np.arange(size_each.sum()) - np.repeat(
+        np.cumsum(size_each) - size_each, size_each)
+    sources = np.repeat(order, size_each)
+    targets = order[np.repeat(begin_each, size_each) + offset]
+    keep = sources != targets
+    sources, targets = sources[keep], targets[keep]
+    by_source = np.argsort(sources, kind="stable")
+    return sources[by_source], targets[by_source]
+
+
+def known_pairs(
+    sources: np.ndarray, targets: np.ndarray, from_code: np.ndarray, to_code: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """pairs whose codes at the differing residue are both in variables"""
+    known = (from_code != UNKNOWN) & (to_code != UNKNOWN)
+    return sources[known], targets[known]
+
+
+def single_mutants(
+    rows: np.ndarray,
+    positions: np.ndarray,
+    variable_num: int,
+    seq_index: Dict[bytes, int],
+    max_bytes: int = 1 << 26,
+) -> Tuple[np.ndarray, ...]:
+    """
+    find indexed sequences differing from rows at one of `positions`,
+    by looking up every substitution of every row in `seq_index`, so that
+    the cost grows with rows instead of indexed sequences, substitutions
+    of at most `max_bytes` are made at once
+
+    Returns
+    -------
+    row, target, position, from_code, to_code : Tuple[np.ndarray, ...]
+        row, indexed sequence and substitution of every neighbour found
+    """
+    rows = np.ascontiguousarray(rows)
+    length = rows.shape[1]
+    positions = np.asarray(positions, dtype=np.int64)
+    codes = np.arange(variable_num, dtype=np.uint8)
+    per_row = len(positions) * variable_num
+    step = max(max_bytes // max(per_row * length, 1), 1)
+    found = [(np.zeros(0, dtype=np.int64),) * 5]
+    for begin in range(0, len(rows), step):
+        chunk = rows[begin:begin + step]
+        mutant = np.repeat(chunk, per_row, axis=0).reshape(
+            len(chunk), len(positions), variable_num, length)
+        mutant[:, np.arange(len(positions))[:, None], codes[None, :].astype(np.int64),
+               positions[:, None]] = codes
+        row = np.repeat(np.arange(begin, begin + len(chunk)), per_row)
+        position = np.tile(np.repeat(positions, variable_num), len(chunk))
+        from_code = np.repeat(chunk[:, positions].ravel(), variable_num)
+        to_code = np.tile(codes, len(chunk) * len(positions))
+        select = (from_code != to_code) & (from_code != UNKNOWN)
+        keys = row_keys(mutant.reshape(-1, length)[select])
+        target = np.fromiter((seq_index.get(key, -1) for key in keys),
+                             dtype=np.int64, count=len(keys))
+        hit = target >= 0
+        found.append((row[select][hit], target[hit], position[select][hit],
+                      from_code[select][hit], to_code[select][hit]))
+    return tuple(np.concatenate(column) for column in zip(*found))
+
+
+def row_keys(matrix: np.ndarray) -> List[bytes]:
+    """turn every row of an encoded matrix into a hashable key"""
+    matrix = np.ascontiguousarray(matrix)
+    return matrix.view(f"V{matrix.shape[1]}").ravel().tolist()
+
+
+def row_index(matrix: np.ndarray) -> Dict[bytes, int]:
+    """map every row of an encoded matrix to its index"""
+    keys = row_keys(matrix)
+    return dict(zip(keys, range(len(keys))))
+
+
 class Dictionary:
     """used variables of sequence"""
 
     def __init__(self) -> None:
         self.chars: Set[str]
+        # sorted chars, a char is encoded as its position
+        self.alphabet: str
 
     @classmethod
     def from_factory(cls, src: Union[List[str], str]) -> Dictionary:
         """make a distionary"""
         dic = cls()
         dic.chars = set(src)
+        dic.alphabet = "".join(sorted(dic.chars))
+        assert len(dic.alphabet) < UNKNOWN, "too many variables for uint8 code"
         return dic
 
+    def table(self) -> np.ndarray:
+        """lookup table from ascii byte to code"""
+        table = np.full(256, UNKNOWN, dtype=np.uint8)
+        for code, char in enumerate(self.alphabet):
+            table[ord(char)] = code
+        return table
+
+    def encode(self, sequence: List[str]) -> np.ndarray:
+        """
+        encode sequences of equal length into a N x L matrix of codes,
+        a char out of variables is encoded as `UNKNOWN`
+
+        Examples
+        --------
+        >> assert(Dictionary.from_factory("AT").encode(["AT", "TT"]).tolist() == [[0, 1], [1, 1]])
+        """
+        length = len(sequence[0])
+        assert all(
+            len(seq) == length for seq in sequence
+        ), "sequences should be of the same length"
+        raw = np.frombuffer("".join(sequence).encode("ascii"), dtype=np.uint8)
+        return self.table()[raw].reshape(len(sequence), length)
+
+    def recode(self, matrix: np.ndarray, alphabet: str) -> np.ndarray:
+        """
+        encode a matrix of codes of another alphabet, a char out of
+        variables is encoded as `UNKNOWN`, the matrix itself is returned
+        if alphabets are the same
+        """
+        if alphabet == self.alphabet:
+            return matrix
+        table = np.full(256, UNKNOWN, dtype=np.uint8)
+        table[:len(alphabet)] = self.table()[
+            np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)]
+        return table[matrix]
+
+    def encode_scenery(self, scenery: Scenery) -> np.ndarray:
+        """encode sequences of a scenery, reuse its matrix if encoded"""
+        if scenery.matrix is not None:
+            return self.recode(scenery.matrix, scenery.alphabet)
+        return self.encode(scenery.sequence)
+
+    def decode(self, codes: np.ndarray) -> Seq:
+        """decode a row of codes into chars"""
+        return tuple(self.alphabet[c] for c in codes)
+
 
 class MetaData:
     """a model for mutation dataset"""
 
+    @metrics.staged("encode")
     def __init__(
         self,
         scenery: Scenery,
         chars: Union[List[str], str],
+        cache: Union[bool, NeighbourCache, None] = None,
     ) -> None:
 
         self.dictionary = Dictionary.from_factory(chars)
+        # None for the cache of `CLIFF_CACHE_DIR` if set, True for it or
+        # the default directory, False for no cache
+        self.cache: Optional[NeighbourCache] = (
+            NeighbourCache.default(cache is True) if cache is None or cache is True
+            else cache or None)
 
         self.variables: Set[str] = set(self.dictionary.chars)
 
         # set attributes
-        self.sequence_length: int = len(scenery.sequence[0])
-        self.sequence: List[str] = scenery.sequence
-
-        self.fitness = scenery.fitness
+        # N x L codes of `dictionary.alphabet`
+        self.matrix: np.ndarray = self.dictionary.encode_scenery(scenery)
+        # N fitness, or N x K fitness of K phenotypes sharing neighbours
+        self.fitness: np.ndarray = np.asarray(
+            scenery.fitness, dtype=np.float64)
+        self.fitness_labels: Optional[List[str]] = scenery.fitness_labels
+        assert self.fitness.ndim in (1, 2), "fitness should be N or N x K"
 
         # inferred attributes
-        self.sequence_num: int = len(self.sequence)
-        self.seq_index: Dict[str, int] = {
-            seq: index for index, seq in enumerate(scenery.sequence)
-        }
-        assert len(self.sequence) == len(self.seq_index)
+        self.sequence_num, self.sequence_length = self.matrix.shape
+        self.seq_index: Dict[bytes, int] = row_index(self.matrix)
+        assert self.sequence_num == len(self.seq_index)
+        assert self.sequence_num == len(self.fitness)
+        # substitutions of every sequence, for `mutation` dataset only,
+        # taken from the parser if it read them instead of searching matrix
+        self.wild_type: Optional[str] = scenery.wild_type
+        self.mutation: Optional[MutationSet] = None
+        if self.wild_type is not None:
+            assert len(self.wild_type) == self.sequence_length, \
+                "wild-type should be of the same length as sequences"
+            wild_code = self.dictionary.table()[
+                np.frombuffer(self.wild_type.encode("ascii"), dtype=np.uint8)]
+            if scenery.mutations is not None:
+                row, position, code = scenery.mutations
+                self.mutation = MutationSet.from_mutations(
+                    self.sequence_num, row, position,
+                    self.dictionary.recode(code, scenery.alphabet), wild_code)
+            else:
+                self.mutation = MutationSet.from_matrix(self.matrix, wild_code)
+        # residues which differ between sequences, any other residue is
+        # constant and never a neighbour, nor a key of epistasis
+        self.variable_positions: np.ndarray = (
+            np.flatnonzero((self.matrix != self.matrix[:1]).any(axis=0))
+            if self.mutation is None else self.mutation.variable_positions())
 
         # lazy attributes
-        self.neighbour: Dict[int, Tuple[NeighbourItem]] = {}
+        self.neighbour = NeighbourGraph.empty(self.dictionary.alphabet)
+        # residues the neighbour graph is searched at, None before it is built
+        self.neighbour_positions: Optional[np.ndarray] = None
 
+    def save(self, path: str, **attributes) -> None:
+        """
+        save encoded sequences and fitness as a binary dataset,
+        which `BinParser` opens without parsing
+        """
+        if self.wild_type is not None:
+            attributes.setdefault("wild_type", self.wild_type)
+        if self.fitness_labels is not None:
+            attributes.setdefault("fitness_labels", self.fitness_labels)
+        BinParser.save(path, self.matrix, self.fitness,
+                       self.dictionary.alphabet, **attributes)
+
+    def index_of(self, sequences: List[str]) -> np.ndarray:
+        """index of every sequence, which should be in the dataset"""
+        keys = row_keys(self.dictionary.encode(sequences))
+        missing = [seq for seq, key in zip(sequences, keys) if key not in self.seq_index]
+        assert not missing, f"sequence {missing[0]} is not in dataset"
+        return np.array([self.seq_index[key] for key in keys], dtype=np.int64)
+
+    @metrics.staged("neighbour")
+    def add_variants(
+        self, sequences: List[str], fitness: Union[List[float], np.ndarray],
+    ) -> np.ndarray:
+        """
+        append new sequences, the neighbour graph is updated in place of
+        being built again if it is built, neighbours of new sequences are
+        found by looking up their substitutions in `seq_index`, so that
+        the search costs by new sequences instead of the whole dataset
+
+        Returns
+        -------
+        index : np.ndarray
+            index of every new sequence
+        """
+        rows = self.dictionary.encode(sequences)
+        fitness = np.asarray(fitness, dtype=np.float64)
+        assert fitness.shape == (len(rows),) + self.fitness.shape[1:], \
+            "fitness should be of new sequences, with the columns of dataset"
+        assert rows.shape[1] == self.sequence_length, \
+            "sequences should be of the same length as dataset"
+        keys = row_keys(rows)
+        assert len(set(keys)) == len(keys) and not any(
+            key in self.seq_index for key in keys), "sequences should be new"
+
+        begin = self.sequence_num
+        index = np.arange(begin, begin + len(rows))
+        self.matrix = np.vstack([self.matrix, rows])
+        self.fitness = np.concatenate([self.fitness, fitness])
+        self.sequence_num = len(self.matrix)
+        self.seq_index.update(zip(keys, index.tolist()))
+        self.variable_positions = np.union1d(
+            self.variable_positions,
+            np.flatnonzero((rows != self.matrix[:1]).any(axis=0)))
+        if self.mutation is not None:
+            self.mutation = self.mutation.extend(
+                MutationSet.from_matrix(rows, self.mutation.wild_code))
+
+        if self.neighbour_positions is None:
+            # a graph of unknown residues is built again on use
+            self.neighbour = NeighbourGraph.empty(self.dictionary.alphabet)
+            return index
+        positions = np.intersect1d(self.neighbour_positions, self.variable_positions)
+        metrics.count("neighbour.candidates", len(rows) * len(positions))
+        row, target, position, from_code, to_code = single_mutants(
+            rows, positions, len(self.dictionary.alphabet), self.seq_index)
+        source = row + begin
+        # both directions of every edge, an edge between new sequences
+        # is found from both of them
+        old = target < begin
+        self.neighbour = self.neighbour.insert(
+            self.sequence_num, self.sequence_length,
+            np.concatenate([source, target[old]]),
+            np.concatenate([target, source[old]]),
+            np.concatenate([position, position[old]]),
+            np.concatenate([from_code, to_code[old]]),
+            np.concatenate([to_code, from_code[old]]),
+        )
+        metrics.count("neighbour.edges", len(source) + old.sum())
+        return index
+
+    def remove_variants(self, sequences: List[str]) -> np.ndarray:
+        """
+        remove sequences of the dataset with their edges, later sequences
+        move forward in order
+
+        Returns
+        -------
+        keep : np.ndarray
+            whether every sequence before removal is kept
+        """
+        keep = np.ones(self.sequence_num, dtype=bool)
+        keep[self.index_of(sequences)] = False
+        for key in row_keys(self.matrix[~keep]):
+            del self.seq_index[key]
+        first = int(np.argmin(keep)) if not keep.all() else self.sequence_num
+        self.matrix = self.matrix[keep]
+        self.fitness = self.fitness[keep]
+        self.sequence_num = len(self.matrix)
+        # sequences before the first removed one keep their index
+        self.seq_index.update(zip(row_keys(self.matrix[first:]),
+                                  range(first, self.sequence_num)))
+        self.variable_positions = np.flatnonzero(
+            (self.matrix != self.matrix[:1]).any(axis=0))
+        if self.mutation is not None:
+            self.mutation = self.mutation.select(keep)
+        if len(self.neighbour) > 0:
+            self.neighbour = self.neighbour.select(keep)
+        return keep
+
+    def update_fitness(
+        self, sequences: List[str], fitness: Union[List[float], np.ndarray],
+    ) -> np.ndarray:
+        """
+        correct fitness of sequences of the dataset, neighbours are kept
+
+        Returns
+        -------
+        index : np.ndarray
+            index of every corrected sequence
+        """
+        index = self.index_of(sequences)
+        if not self.fitness.flags.writeable:
+            # a copy of a read-only memory-mapped dataset
+            self.fitness = np.array(self.fitness)
+        self.fitness[index] = np.asarray(fitness, dtype=np.float64)
+        return index
+
+    @metrics.staged("neighbour")
     def get_neighbour(
-        self, use_keys: Tuple[MultiResidue] = tuple(), tqdm_enable=True
+        self, use_keys: Tuple[MultiResidue] = tuple(), tqdm_enable=True,
+        progress: Optional[Progress] = None,
     ) -> None:
-        """fetch the neighbour adjacency list"""
-        use_keys = tuple((i,) for i in range(self.sequence_length))
-        self.neighbour: Dict[int, Tuple[NeighbourItem]] = Neighbourhood(
-            use_keys, self.sequence, self.variables, tqdm_enable
-        ).get()
+        """
+        fetch the neighbour adjacency list, mutated at residues of `use_keys`,
+        progress is reported to `progress`, or a tqdm bar if `tqdm_enable`
+        """
+        progress = as_progress(tqdm_enable if progress is None else progress)
+        positions = sorted({res for key in use_keys for res in key})
+        if len(positions) == 0:
+            positions = list(range(self.sequence_length))
+        # residues constant for now may vary after `add_variants`
+        self.neighbour_positions = np.array(positions, dtype=np.int64)
+        positions = np.intersect1d(positions, self.variable_positions)
+        alphabet = self.dictionary.alphabet
+
+        key = None
+        if self.cache is not None:
+            key = fingerprint(self.matrix, alphabet, positions.tolist())
+            cached = self.cache.load(key)
+            if cached is not None:
+                arrays, _ = cached
+                metrics.count("neighbour.cache_hits")
+                self.neighbour = NeighbourGraph(**arrays, alphabet=alphabet)
+                return
+
+        if self.mutation is not None:
+            self.neighbour = MutationNeighbourhood(
+                positions, self.mutation, self.sequence_length, alphabet,
+                progress).get()
+        else:
+            # search on variable columns only, back to original residues
+            columns = self.variable_positions
+            self.neighbour = Neighbourhood(
+                np.searchsorted(columns, positions),
+                np.ascontiguousarray(self.matrix[:, columns]),
+                alphabet, progress).get()
+            self.neighbour.position = columns[
+                self.neighbour.position].astype(np.int32)
+        metrics.count("neighbour.edges", self.neighbour.edge_num)
+        if key is not None:
+            self.cache.store(key, self.neighbour.arrays(), {"alphabet": alphabet})
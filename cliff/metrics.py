@@ -0,0 +1,179 @@
+"""stage-level profiling of wall time, cpu time, peak memory and counters"""
+from __future__ import annotations
+from contextlib import contextmanager, nullcontext
+import functools
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional
+
+# null stage returned while profiling is off, shared to avoid allocation
+NULL_STAGE = nullcontext()
+# profiler receiving stages and counters, None while profiling is off
+ACTIVE: Optional[Profiler] = None
+
+
+class StageStat:
+    """accumulated measures of every run of a stage"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        # peak traced memory inside the stage, None if memory is not traced
+        self.peak_bytes: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """measures by name"""
+        return dict(vars(self))
+
+
+class Report:
+    """measures of stages and counters of a profiled run"""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, StageStat] = {}
+        self.counters: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """structured report, stages in order of their first run"""
+        return {
+            "stages": {name: stat.to_dict() for name, stat in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+    def save(self, path: str) -> None:
+        """write the report as json"""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+class Stage:
+    """a run of a stage, as a context manager"""
+
+    def __init__(self, profiler: Profiler, name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        # highest peak of finished inner stages
+        self.inner_peak = 0
+
+    def __enter__(self) -> Stage:
+        self.profiler.enter(self)
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        wall, cpu = time.perf_counter(), time.process_time()
+        self.profiler.exit(self, wall - self.wall, cpu - self.cpu)
+
+
+class Profiler:
+    """
+    collect a `Report` of stages and counters, peak memory of a stage is
+    traced by tracemalloc if `memory`, which slows down python code
+
+    Stages and counters are expected from the thread which started
+    profiling, a stage inside a running stage of the same name is merged
+    into the running one
+    """
+
+    def __init__(self, memory: bool = True) -> None:
+        self.memory = memory
+        self.report = Report()
+        self.running: List[Stage] = []
+
+    def stage(self, name: str) -> ContextManager:
+        """measure a stage named `name`"""
+        if any(running.name == name for running in self.running):
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """add `value` to a counter"""
+        self.report.counters[name] = self.report.counters.get(name, 0) + int(value)
+
+    def enter(self, started: Stage) -> None:
+        """start a stage"""
+        if self.memory and tracemalloc.is_tracing():
+            if self.running:
+                outer = self.running[-1]
+                outer.inner_peak = max(outer.inner_peak,
+                                       tracemalloc.get_traced_memory()[1])
+            reset_peak = getattr(tracemalloc, "reset_peak", None)
+            if reset_peak is not None:
+                reset_peak()
+        self.running.append(started)
+
+    def exit(self, finished: Stage, wall: float, cpu: float) -> None:
+        """finish a stage, the running stage of the profiler"""
+        self.running.pop()
+        stat = self.report.stages.setdefault(finished.name, StageStat())
+        stat.calls += 1
+        stat.wall_seconds += wall
+        stat.cpu_seconds += cpu
+        if self.memory and tracemalloc.is_tracing():
+            peak = max(finished.inner_peak, tracemalloc.get_traced_memory()[1])
+            stat.peak_bytes = max(stat.peak_bytes or 0, peak)
+            if self.running:
+                outer = self.running[-1]
+                outer.inner_peak = max(outer.inner_peak, peak)
+
+    @contextmanager
+    def activate(self) -> Iterator[Report]:
+        """make the profiler receive stages and counters of cliff"""
+        global ACTIVE  # pylint: disable=global-statement
+        assert ACTIVE is None, "profiling is already active"
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        ACTIVE = self
+        try:
+            yield self.report
+        finally:
+            ACTIVE = None
+            if tracing:
+                tracemalloc.stop()
+
+
+def stage(name: str) -> ContextManager:
+    """
+    measure a stage if profiling is on
+
+    Examples
+    --------
+    >> with stage("neighbour"): build()
+    """
+    if ACTIVE is None:
+        return NULL_STAGE
+    return ACTIVE.stage(name)
+
+
+def staged(name: str) -> Callable[[Callable], Callable]:
+    """decorate a function, every call of it is a stage named `name`"""
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name: str, value: int = 1) -> None:
+    """add `value` to a counter if profiling is on"""
+    if ACTIVE is not None:
+        ACTIVE.count(name, value)
+
+
+def profiling(memory: bool = True) -> ContextManager[Report]:
+    """
+    profile stages of cliff inside the context
+
+    Examples
+    --------
+    >> with profiling() as report: Ruggness(meta).calculate()
+    >> report.save("profile.json")
+    """
+    return Profiler(memory).activate()
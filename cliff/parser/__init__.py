@@ -1,4 +1,5 @@
 """load public class"""
 from .mut_parser import MutArgs, MutParser
 from .seq_parser import SeqArgs, SeqParser
+from .bin_parser import BinParser
 from .base import Scenery
@@ -1,14 +1,66 @@
 """abstract interface for parser"""
 import abc
-from typing import Any, List, Union
+from typing import Any, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
 
 class Scenery:
     """data struct for mutation dataset"""
-    sequence: List[str]
-    fitness: List[float]
+    # fitness of every sequence, or N x K fitness of K phenotypes
+    # such as conditions, replicates or time points
+    fitness: Union[List[float], np.ndarray]
+    # names of K fitness columns, None for a single fitness
+    fitness_labels: Optional[List[str]] = None
+    # sequences encoded as N x L codes of `alphabet`, set by parsers
+    # which never hold sequences as strings
+    matrix: Optional[np.ndarray] = None
+    alphabet: Optional[str] = None
+    # wild-type of `mutation` dataset, every sequence is a set of
+    # substitutions against it, None for `sequence` dataset
+    wild_type: Optional[str] = None
+    # row, position and code of `alphabet` of every substitution against
+    # wild-type, by row and position, set by parsers which read them,
+    # so that mutation sets are not searched in `matrix`
+    mutations: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+    _sequence: Optional[List[str]] = None
+
+    @property
+    def sequence(self) -> List[str]:
+        """sequences as strings, decoded from `matrix` if not set"""
+        if self._sequence is None and self.matrix is not None:
+            chars = np.frombuffer(self.alphabet.encode("ascii"), dtype=np.uint8)
+            raw = np.ascontiguousarray(chars[self.matrix])
+            return raw.view(f"S{raw.shape[1]}").ravel().astype(str).tolist()
+        return self._sequence
+
+    @sequence.setter
+    def sequence(self, sequence: List[str]) -> None:
+        self._sequence = sequence
+
+
+def fitness_columns(label: Union[str, List[str]]) -> List[str]:
+    """csv columns of a fitness label, or of a list of them"""
+    return [label] if isinstance(label, str) else list(label)
+
+
+def read_fitness(
+    data: pd.DataFrame, label: Union[str, List[str]],
+) -> Tuple[Union[List[float], np.ndarray], Optional[List[str]]]:
+    """
+    fitness of a dataframe, a list for a label, a N x K matrix for a list
+    of K labels
+
+    Returns
+    -------
+    fitness, labels : Tuple[Union[List[float], np.ndarray], Optional[List[str]]]
+        fitness and names of its columns, None for a single label
+    """
+    if isinstance(label, str):
+        return data[label].to_list(), None
+    labels = list(label)
+    return data[labels].to_numpy(dtype=np.float64), labels
 
 
 class Parser(metaclass=abc.ABCMeta):
@@ -0,0 +1,81 @@
+"""parser for binary `cliff` dataset"""
+import json
+import os
+from typing import Any, Iterator
+
+import numpy as np
+
+from .. import metrics
+from .base import Parser, Scenery
+
+FORMAT_VERSION = 1
+INFO_FILE = "dataset.json"
+
+
+class BinParser(Parser):
+    """
+    parser for binary `cliff` dataset, a directory of `matrix.npy` for
+    encoded sequences, `fitness.npy` of N or N x K fitness and `dataset.json`
+    for alphabet, `fitness_labels` and other metadata, written by
+    `MetaData.save` or `cliff convert`
+    """
+
+    @staticmethod
+    def is_dataset(path: str) -> bool:
+        """whether a path is a binary dataset"""
+        return os.path.isfile(os.path.join(path, INFO_FILE))
+
+    @staticmethod
+    def info(path: str) -> dict:
+        """metadata of a binary dataset"""
+        with open(os.path.join(path, INFO_FILE), encoding="utf-8") as file:
+            info = json.load(file)
+        assert info.get("version") == FORMAT_VERSION, \
+            f"unsupported dataset version {info.get('version')}"
+        return info
+
+    @classmethod
+    @metrics.staged("parse")
+    def parse(cls, data: str, args: Any = None) -> Scenery:
+        """memory-map a binary dataset without copying, `args` is unused"""
+        info = cls.info(data)
+        sce = Scenery()
+        sce.alphabet = info["alphabet"]
+        sce.wild_type = info.get("wild_type")
+        sce.matrix = np.load(os.path.join(data, "matrix.npy"), mmap_mode="r")
+        sce.fitness = np.load(os.path.join(data, "fitness.npy"), mmap_mode="r")
+        sce.fitness_labels = info.get("fitness_labels")
+        return sce
+
+    @classmethod
+    def iter_parse(cls, path: str, chunksize: int) -> Iterator[Scenery]:
+        """generate sceneries from successive rows of a binary dataset"""
+        whole = cls.parse(path)
+        for begin in range(0, len(whole.matrix), chunksize):
+            sce = Scenery()
+            sce.alphabet = whole.alphabet
+            sce.wild_type = whole.wild_type
+            sce.matrix = whole.matrix[begin:begin + chunksize]
+            sce.fitness = whole.fitness[begin:begin + chunksize]
+            sce.fitness_labels = whole.fitness_labels
+            yield sce
+
+    @staticmethod
+    def save(path: str, matrix: np.ndarray, fitness: np.ndarray,
+             alphabet: str, **attributes: Any) -> None:
+        """write a binary dataset, `attributes` are kept in metadata"""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "matrix.npy"),
+                np.ascontiguousarray(matrix, dtype=np.uint8))
+        np.save(os.path.join(path, "fitness.npy"),
+                np.ascontiguousarray(fitness, dtype=np.float64))
+        info = {
+            "format": "cliff",
+            "version": FORMAT_VERSION,
+            "alphabet": alphabet,
+            "sequence_num": int(matrix.shape[0]),
+            "sequence_length": int(matrix.shape[1]),
+            **attributes,
+        }
+        with open(os.path.join(path, INFO_FILE), "w", encoding="utf-8") as file:
+            json.dump(info, file, indent=2)
@@ -1,18 +1,37 @@
 """parser for `mutation` dataset"""
-from typing import Union, cast
+from typing import Dict, List, Tuple, Union, cast
 
+import numpy as np
 import pandas as pd
 
-from .base import Parser, Scenery
+from .. import metrics
+from .base import Parser, Scenery, fitness_columns, read_fitness
+from .bin_parser import BinParser
 
 
 class MutArgs:
     """arguments for `mutation` parser"""
     mutation_label: str
-    fitness_label: str
+    # a label, or a list of labels for N x K fitness
+    fitness_label: Union[str, List[str]]
     wile_type: str
     # 0 for index range [1 -> num], 1 for index range [0 -> num-1]
     vt_offset: int
+    # rows of a chunk for reading a file chunk by chunk, 0 for whole file
+    chunksize: int = 0
+    # processes encoding chunks of a file
+    n_jobs: int = 1
+
+
+def ascii_codes(chars: str) -> np.ndarray:
+    """ascii byte of every char"""
+    return np.frombuffer(chars.encode("ascii"), dtype=np.uint8)
+
+
+def column_types(args: MutArgs) -> Dict[str, type]:
+    """types of csv columns of mutation and fitness"""
+    return {args.mutation_label: str,
+            **{label: float for label in fitness_columns(args.fitness_label)}}
 
 
 class MutParser(Parser):
@@ -33,24 +52,149 @@ class MutParser(Parser):
             now = now[:index] + mut[-1] + now[index + 1:]
         return now
 
+    @staticmethod
+    def parse_mutations(
+        mut_lines: pd.Series, wild_type: str, vt_offset: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        split all mutations of all lines at once
+
+        Returns
+        -------
+        row, index, from, to : Tuple[np.ndarray, ...]
+            line, 0-based residue index and ascii bytes of every mutation
+        """
+        lines = mut_lines.to_list()
+        if len(lines) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty.astype(np.uint8), empty.astype(np.uint8)
+        tokens = np.array(":".join(lines).split(":"), dtype=bytes)
+        row = np.repeat(np.arange(len(lines)),
+                        [line.count(":") + 1 for line in lines])
+        keep = tokens != b""
+        tokens, row = tokens[keep], row[keep]
+
+        length = np.char.str_len(tokens)
+        short = length < 3
+        assert not short.any(), f"invalid mutation {tokens[short][0].decode()}"
+        if len(tokens) == 0:
+            empty = np.zeros(0, dtype=np.uint8)
+            return row, row, empty, empty
+
+        # tokens as rows of ascii bytes, zero padded to the longest token,
+        # residue index is between the first and the last byte of a token
+        raw = tokens.view(np.uint8).reshape(len(tokens), -1)
+        body = raw[:, 1:-1]
+        body_mask = np.arange(body.shape[1]) < (length - 2)[:, None]
+        sign = body[:, 0] == ord("-")
+        body_mask[:, 0] &= ~sign
+        digit = body.astype(np.int64) - ord("0")
+        bad = (body_mask & ((digit < 0) | (digit > 9))).any(axis=1)
+        assert not bad.any(), f"invalid mutation {tokens[bad][0].decode()}"
+
+        # horner scheme over digit columns, skipping padding and sign
+        number = np.zeros(len(tokens), dtype=np.int64)
+        for col in range(body.shape[1]):
+            number = np.where(body_mask[:, col], number * 10 + digit[:, col], number)
+        index = np.where(sign, -number, number) + vt_offset - 1
+        outside = (index < 0) | (index >= len(wild_type))
+        assert not outside.any(
+        ), f"mutation {tokens[outside][0].decode()} is out of wild-type"
+        return row, index, raw[:, 0], raw[np.arange(len(tokens)), length - 1]
+
     @classmethod
+    def encode_mut_seq(
+        cls, mut_lines: pd.Series, wild_type: str, vt_offset: int
+    ) -> Tuple[np.ndarray, str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        generate encoded mutation sequences of all lines,
+        by writing all mutations into copies of encoded wild-type
+
+        Returns
+        -------
+        matrix, alphabet, mutations : Tuple[np.ndarray, str, Tuple[np.ndarray, ...]]
+            N x L codes of alphabet, alphabet of wild-type and mutations,
+            and row, position and code of every substitution, see `Scenery`
+        """
+        row, index, from_char, to_char = cls.parse_mutations(
+            mut_lines, wild_type, vt_offset)
+        wild_char = ascii_codes(wild_type)
+        mismatch = wild_char[index] != from_char
+        assert not mismatch.any(), (
+            f"mismatch between mutation {chr(from_char[mismatch][0])}"
+            f"{index[mismatch][0] - vt_offset + 1} and wild-type "
+            f"{chr(wild_char[index[mismatch][0]])}{index[mismatch][0]}")
+        # a residue is mutated at most once by a line
+        _, first = np.unique(row.astype(np.int64) * len(wild_type) + index,
+                             return_index=True)
+        again = np.setdiff1d(np.arange(len(row)), first)
+        assert len(again) == 0, (
+            f"residue {index[again][0] - vt_offset + 1} is mutated more than once "
+            f"in line {mut_lines.iloc[row[again][0]]}")
+
+        alphabet = np.union1d(wild_char, to_char).astype(np.uint8)
+        matrix = np.tile(np.searchsorted(alphabet, wild_char).astype(np.uint8),
+                         (len(mut_lines), 1))
+        code = np.searchsorted(alphabet, to_char).astype(np.uint8)
+        matrix[row, index] = code
+        # a mutation back to wild-type is no substitution
+        select = to_char != wild_char[index]
+        order = np.lexsort((index[select], row[select]))
+        mutations = (row[select][order], index[select][order], code[select][order])
+        return matrix, alphabet.tobytes().decode("ascii"), mutations
+
+    @classmethod
+    @metrics.staged("parse")
     def parse(cls, data: Union[str, pd.DataFrame], args: MutArgs) -> Scenery:
+        if isinstance(data, str) and BinParser.is_dataset(data):
+            return BinParser.parse(data)
+        if isinstance(data, str) and args.chunksize > 0:
+            return cls.parse_chunks(data, args)
         if isinstance(data, str):
-            file = pd.read_csv(
-                data, dtype={args.mutation_label: str, args.fitness_label: float})
+            file = pd.read_csv(data, dtype=column_types(args))
             return cls.parse(file, args)
 
         data = cast(pd.DataFrame, data)
-        assert (
-            args.mutation_label in data.columns and args.fitness_label in data.columns
-        )
+        assert args.mutation_label in data.columns and all(
+            label in data.columns for label in fitness_columns(args.fitness_label))
+
+        sce = Scenery()
+        sce.wild_type = args.wile_type
+        sce.matrix, sce.alphabet, sce.mutations = cls.encode_mut_seq(
+            data[args.mutation_label].fillna(''), args.wile_type, args.vt_offset)
+        sce.fitness, sce.fitness_labels = read_fitness(data, args.fitness_label)
+        return sce
+
+    @classmethod
+    def parse_chunks(cls, path: str, args: MutArgs) -> Scenery:
+        """parse chunks of a file by a pool of `args.n_jobs` processes"""
+        # pylint: disable=import-outside-toplevel
+        from joblib import Parallel, delayed
+
+        usecols = [args.mutation_label, *fitness_columns(args.fitness_label)]
+        reader = pd.read_csv(path, usecols=usecols, dtype=column_types(args),
+                             chunksize=args.chunksize)
+        with reader:
+            parts = Parallel(n_jobs=args.n_jobs)(
+                delayed(cls.parse)(chunk, args) for chunk in reader)
+        if not parts:
+            # a file of only a header has no chunk, but an empty dataset
+            return cls.parse(pd.read_csv(path, usecols=usecols, dtype=column_types(args)), args)
 
         sce = Scenery()
-        data[args.mutation_label].fillna('', inplace=True)
-        sce.sequence = (
-            data[args.mutation_label]
-            .apply(cls.generate_mut_seq, args=(args.wile_type, args.vt_offset))
-            .to_list()
-        )
-        sce.fitness = data[args.fitness_label].to_list()
+        sce.wild_type = args.wile_type
+        sce.alphabet = "".join(sorted(set().union(*(part.alphabet for part in parts))))
+        union = ascii_codes(sce.alphabet)
+        tables = [np.searchsorted(union, ascii_codes(part.alphabet)).astype(np.uint8)
+                  for part in parts]
+        sce.matrix = np.vstack([table[part.matrix] for part, table in zip(parts, tables)])
+        offsets = np.cumsum([0] + [len(part.matrix) for part in parts[:-1]])
+        sce.mutations = tuple(np.concatenate(column) for column in zip(*(
+            (part.mutations[0] + offset, part.mutations[1], table[part.mutations[2]])
+            for part, table, offset in zip(parts, tables, offsets.tolist()))))
+        sce.fitness_labels = parts[0].fitness_labels
+        if sce.fitness_labels is None:
+            sce.fitness = [one for part in parts for one in part.fitness]
+        else:
+            sce.fitness = np.vstack([part.fitness for part in parts])
         return sce
@@ -1,33 +1,51 @@
 """parser for `mutation` dataset"""
-from typing import Union, cast
+from typing import Iterator, List, Union, cast
 
 
 import pandas as pd
 
-from .base import Parser, Scenery
+from .. import metrics
+from .base import Parser, Scenery, fitness_columns, read_fitness
+from .bin_parser import BinParser
 
 
 class SeqArgs:
     """arguments for `sequence` parser"""
     sequence_label: str
-    fitness_label: str
+    # a label, or a list of labels for N x K fitness
+    fitness_label: Union[str, List[str]]
 
 
 class SeqParser(Parser):
     """parser for `mutation` dataset"""
 
     @classmethod
+    @metrics.staged("parse")
     def parse(cls, data: Union[str, pd.DataFrame], args: SeqArgs) -> Scenery:
+        if isinstance(data, str) and BinParser.is_dataset(data):
+            return BinParser.parse(data)
         if isinstance(data, str):
             file = pd.read_csv(data)
             return cls.parse(file, args)
 
         data = cast(pd.DataFrame, data)
-        assert (
-            args.sequence_label in data.columns and args.fitness_label in data.columns
-        )
+        assert args.sequence_label in data.columns and all(
+            label in data.columns for label in fitness_columns(args.fitness_label))
 
         sce = Scenery()
         sce.sequence = data[args.sequence_label].to_list()
-        sce.fitness = data[args.fitness_label].to_list()
+        sce.fitness, sce.fitness_labels = read_fitness(data, args.fitness_label)
         return sce
+
+    @classmethod
+    def iter_parse(cls, path: str, args: SeqArgs, chunksize: int) -> Iterator[Scenery]:
+        """
+        generate sceneries from successive chunks of a csv file,
+        so that the whole file is never loaded at once
+        """
+        reader = pd.read_csv(
+            path, usecols=[args.sequence_label, *fitness_columns(args.fitness_label)],
+            chunksize=chunksize)
+        with reader:
+            for chunk in reader:
+                yield cls.parse(chunk, args)
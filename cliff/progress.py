@@ -0,0 +1,98 @@
+"""progress of long calculations, reported chunk by chunk"""
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Union
+
+
+class Progress:
+    """
+    receiver of progress, which ignores everything
+
+    A task is started with its total number of chunks, None if unknown,
+    advanced as chunks are finished, such as a residue of neighbour search
+    or a batch of epistasis keys, and finished at last
+    """
+
+    def start(self, task: str, total: Optional[int] = None) -> None:
+        """a task of `total` chunks is started"""
+
+    def advance(self, task: str, done: int = 1) -> None:
+        """`done` more chunks of a task are finished"""
+
+    def finish(self, task: str) -> None:
+        """a task is finished"""
+
+
+# default receiver, which costs a method call per chunk
+NO_PROGRESS = Progress()
+
+
+class TqdmProgress(Progress):
+    """show a tqdm bar of every running task"""
+
+    def __init__(self, **options: Any) -> None:
+        # options of every bar, such as `file` or `leave`
+        self.options = options
+        self.bars: Dict[str, Any] = {}
+
+    def start(self, task: str, total: Optional[int] = None) -> None:
+        # pylint: disable=import-outside-toplevel
+        from tqdm import tqdm
+
+        self.bars[task] = tqdm(total=total, desc=task, **self.options)
+
+    def advance(self, task: str, done: int = 1) -> None:
+        self.bars[task].update(done)
+
+    def finish(self, task: str) -> None:
+        self.bars.pop(task).close()
+
+
+class LogProgress(Progress):
+    """
+    log progress as json lines for batch schedulers, at most once per
+    `interval` seconds of every task besides its start and finish
+    """
+
+    def __init__(
+        self, logger: Union[str, logging.Logger] = "cliff.progress",
+        interval: float = 10.0, level: int = logging.INFO,
+    ) -> None:
+        self.logger = logging.getLogger(logger) if isinstance(logger, str) else logger
+        self.interval = interval
+        self.level = level
+        # task -> [total, done, started, last logged]
+        self.tasks: Dict[str, list] = {}
+
+    def log(self, event: str, task: str) -> None:
+        """log a json line of the task"""
+        total, done, started, _ = self.tasks[task]
+        now = time.monotonic()
+        self.tasks[task][3] = now
+        self.logger.log(self.level, json.dumps({
+            "event": event, "task": task, "done": done, "total": total,
+            "elapsed": round(now - started, 3),
+        }))
+
+    def start(self, task: str, total: Optional[int] = None) -> None:
+        now = time.monotonic()
+        self.tasks[task] = [total, 0, now, now]
+        self.log("start", task)
+
+    def advance(self, task: str, done: int = 1) -> None:
+        state = self.tasks[task]
+        state[1] += done
+        if time.monotonic() - state[3] >= self.interval:
+            self.log("advance", task)
+
+    def finish(self, task: str) -> None:
+        self.log("finish", task)
+        del self.tasks[task]
+
+
+def as_progress(progress: Union[bool, Progress, None]) -> Progress:
+    """a receiver of progress, a tqdm bar for True and nothing for False or None"""
+    if isinstance(progress, Progress):
+        return progress
+    return TqdmProgress() if progress else NO_PROGRESS
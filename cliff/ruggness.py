@@ -1,9 +1,283 @@
 """Cauculation of dataset Ruggness"""
-from itertools import product
-from typing import Dict, List
+from __future__ import annotations
+from statistics import NormalDist
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
 import numpy as np
+import pandas as pd
+
+from cliff.metadata import Dictionary, MetaData, group_sum, row_keys, single_mutants
+from cliff import metrics
+from cliff.parser import BinParser, Scenery, SeqArgs, SeqParser
+from cliff.progress import NO_PROGRESS, Progress
+from cliff.schedule import Scheduler
+
+# replicates are estimated by weights of every edge, `unit` is resampled
+RESAMPLE_UNITS = ("variant", "edge")
+RESAMPLE_METHODS = ("bootstrap", "jackknife")
+# elements of a block of replicate weights, bounding memory of a worker
+WEIGHT_BLOCK = 1 << 22
+
+
+def mutation_label(
+    position: np.ndarray, from_code: np.ndarray, to_code: np.ndarray,
+    variable_num: int,
+) -> np.ndarray:
+    """
+    number every mutation (index, from, to) by a dense integer
+
+    Examples
+    --------
+    >> assert(mutation_label(np.array([1]), np.array([0]), np.array([1]), 2).tolist() == [5])
+    """
+    position = position.astype(np.int64)
+    return (position * variable_num + from_code) * variable_num + to_code
+
+
+def group_recenter(label: np.ndarray, value: np.ndarray) -> np.ndarray:
+    """
+    recenter values to the mean of their label group
+
+    Parameters
+    ----------
+    label: np.ndarray
+        non-negative group label of every value
+
+    value: np.ndarray
+        values to be recentered, or N x K values recentered by column
+
+    Returns
+    -------
+    recentered : np.ndarray
+        value minus mean of its group
+    """
+    count = np.bincount(label)
+    total = group_sum(label, value, len(count))
+    # an empty group sums to zero
+    mean = (total.T / np.maximum(count, 1)).T
+    return value - mean[label]
+
+
+def weighted_ruggness(
+    weight: np.ndarray, group_start: np.ndarray, centered: np.ndarray,
+) -> np.ndarray:
+    """
+    ruggness of every row of edge weights, edges sorted by mutation
+
+    Parameters
+    ----------
+    weight: np.ndarray
+        R x E weights of edges, as times an edge is drawn
+
+    group_start: np.ndarray
+        first edge of every mutation
+
+    centered: np.ndarray
+        fitness difference of every edge minus mean of its mutation,
+        which is shift invariant but keeps sums of squares small
+
+    Returns
+    -------
+    ruggness : np.ndarray
+        weighted variance of recentered differences of every row,
+        nan for a row without any edge
+    """
+    count = np.add.reduceat(weight, group_start, axis=1)
+    total = np.add.reduceat(weight * centered, group_start, axis=1)
+    square = np.add.reduceat(weight * centered ** 2, group_start, axis=1)
+    square -= np.divide(total ** 2, count, out=np.zeros_like(total), where=count > 0)
+    # sums of squares are never negative besides rounding
+    np.maximum(square, 0.0, out=square)
+    edges = count.sum(axis=1)
+    return np.divide(square.sum(axis=1), edges,
+                     out=np.full(len(edges), np.nan), where=edges > 0)
+
+
+def bootstrap_batch(
+    replicates: Sequence[int],
+    group_start: np.ndarray,
+    centered: np.ndarray,
+    source: np.ndarray,
+    target: np.ndarray,
+    variant_num: int,
+    unit: str,
+    seed: int,
+) -> List[float]:
+    """
+    ruggness of bootstrap replicates, a replicate draws `unit` with
+    replacement by a generator of `(seed, replicate)`, so that it does
+    not depend on workers, an edge is weighted by draws of both of its
+    variants or by draws of itself
+    """
+    edge_num = len(centered)
+    rows = max(WEIGHT_BLOCK // max(edge_num, 1), 1)
+    results: List[float] = []
+    for begin in range(0, len(replicates), rows):
+        weight = np.empty((len(replicates[begin:begin + rows]), edge_num))
+        for row, replicate in enumerate(replicates[begin:begin + rows]):
+            rng = np.random.default_rng([seed, replicate])
+            if unit == "variant":
+                drawn = np.bincount(rng.integers(0, variant_num, variant_num),
+                                    minlength=variant_num)
+                weight[row] = drawn[source] * drawn[target]
+            else:
+                weight[row] = np.bincount(rng.integers(0, edge_num, edge_num),
+                                          minlength=edge_num)
+        results.extend(weighted_ruggness(weight, group_start, centered).tolist())
+    return results
+
+
+def delete_one(
+    replicate: np.ndarray, edge: np.ndarray, replicate_num: int,
+    group: np.ndarray, centered: np.ndarray,
+) -> np.ndarray:
+    """
+    ruggness of every replicate without its edges, edge `edge[i]` is left
+    out of replicate `replicate[i]`, only sums of mutations losing edges
+    are updated, so that all replicates cost a pass over edges
+
+    Returns
+    -------
+    ruggness : np.ndarray
+        ruggness of every replicate, nan for a replicate without any edge
+    """
+    group_num = int(group.max(initial=-1)) + 1
+    count = np.bincount(group, minlength=group_num).astype(np.float64)
+    total = np.bincount(group, weights=centered, minlength=group_num)
+    square = np.bincount(group, weights=centered ** 2, minlength=group_num)
+    kept = square - np.divide(total ** 2, count, out=np.zeros(group_num), where=count > 0)
+
+    # sums left out of every (replicate, mutation)
+    pair, pair_of_edge = np.unique(
+        replicate.astype(np.int64) * group_num + group[edge], return_inverse=True)
+    pair_of_edge = pair_of_edge.reshape(-1)
+    owner, lost_group = pair // group_num, pair % group_num
+    lost_count = np.bincount(pair_of_edge, minlength=len(pair))
+    lost_total = np.bincount(pair_of_edge, weights=centered[edge], minlength=len(pair))
+    lost_square = np.bincount(pair_of_edge, weights=centered[edge] ** 2, minlength=len(pair))
+
+    left_count = count[lost_group] - lost_count
+    left_total = total[lost_group] - lost_total
+    left = np.maximum((square[lost_group] - lost_square) - np.divide(
+        left_total ** 2, left_count, out=np.zeros(len(pair)), where=left_count > 0), 0.0)
+    change = np.bincount(owner, weights=kept[lost_group] - left, minlength=replicate_num)
+    edges = len(centered) - np.bincount(owner, weights=lost_count, minlength=replicate_num)
+    return np.divide(kept.sum() - change, edges,
+                     out=np.full(replicate_num, np.nan), where=edges > 0)
+
+
+class RuggnessInterval:
+    """
+    ruggness of a scenery with its standard error and confidence interval,
+    by percentiles of bootstrap replicates or a normal interval of jackknife
+    """
+
+    def __init__(
+        self, estimate: float, replicates: np.ndarray, method: str, unit: str,
+        confidence: float,
+    ) -> None:
+        self.estimate = estimate
+        self.method = method
+        self.unit = unit
+        self.confidence = confidence
+        # ruggness of every replicate, nan for a replicate without any edge
+        self.replicates = replicates
+
+        valid = replicates[~np.isnan(replicates)]
+        alpha = (1.0 - confidence) / 2
+        if method == "jackknife":
+            num = len(valid)
+            self.std_error = float(np.sqrt((num - 1) / num * ((valid - valid.mean()) ** 2).sum())) \
+                if num > 1 else float("nan")
+            width = NormalDist().inv_cdf(1.0 - alpha) * self.std_error
+            self.low, self.high = estimate - width, estimate + width
+        else:
+            self.std_error = float(valid.std(ddof=1)) if len(valid) > 1 else float("nan")
+            self.low, self.high = (float(bound) for bound in np.percentile(
+                valid, [100 * alpha, 100 * (1.0 - alpha)])) \
+                if len(valid) > 0 else (float("nan"), float("nan"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """summary by name, without replicates"""
+        return {name: value for name, value in vars(self).items() if name != "replicates"}
+
+
+class RuggnessDecomposition:
+    """
+    ruggness of a scenery split into mutations (position, from, to) and
+    positions, the contribution of a mutation is the sum of squared
+    differences from its mean over all edges, so that contributions of
+    mutations, or of positions, sum to ruggness
+
+    Parameters
+    ----------
+    count, total, deviation: np.ndarray
+        edges, sum of fitness difference and sum of squared difference
+        from the mean of every mutation label, see `mutation_label`,
+        a row of K sums for N x K fitness
 
-from cliff.metadata import MetaData
+    alphabet: str
+        variables of codes
+
+    fitness_labels: Optional[List[str]]
+        names of K fitness columns
+    """
+
+    def __init__(
+        self, count: np.ndarray, total: np.ndarray, deviation: np.ndarray,
+        alphabet: str, fitness_labels: Optional[List[str]] = None,
+    ) -> None:
+        variable_num = len(alphabet)
+        label = np.flatnonzero(count > 0)
+        self.alphabet = alphabet
+        self.fitness_labels = fitness_labels
+        self.position = label // variable_num ** 2
+        self.from_code = label // variable_num % variable_num
+        self.to_code = label % variable_num
+        self.count = count[label].astype(np.int64)
+        self.mean = (total[label].T / self.count).T
+        # sums of squares are never negative besides rounding
+        self.deviation = np.maximum(deviation[label], 0.0)
+        self.edges = int(self.count.sum())
+        self.ruggness = self.deviation.sum(axis=0) / max(self.edges, 1)
+
+    def frame(self, columns: Dict[str, np.ndarray], values: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """a table of columns and values, a `fitness` column and rows of every fitness column"""
+        if self.deviation.ndim == 1:
+            return pd.DataFrame({**columns, **values})
+        names = self.fitness_labels or [str(i) for i in range(self.deviation.shape[1])]
+        return pd.concat([
+            pd.DataFrame({"fitness": name, **columns,
+                          **{key: value[:, column] for key, value in values.items()}})
+            for column, name in enumerate(names)], ignore_index=True)
+
+    def mutations(self) -> pd.DataFrame:
+        """
+        table of every mutation, its edges, mean and variance of fitness
+        difference, and contribution to ruggness
+        """
+        chars = np.array(list(self.alphabet))
+        return self.frame(
+            {"position": self.position, "from": chars[self.from_code],
+             "to": chars[self.to_code], "count": self.count},
+            {"mean": self.mean,
+             "variance": (self.deviation.T / self.count).T,
+             "contribution": self.deviation / max(self.edges, 1)})
+
+    def positions(self) -> pd.DataFrame:
+        """
+        table of every mutated position, its mutations, edges, variance of
+        fitness difference around means of mutations, and contribution
+        to ruggness
+        """
+        position, index = np.unique(self.position, return_inverse=True)
+        index = index.reshape(-1)
+        count = np.bincount(index, weights=self.count).astype(np.int64)
+        deviation = group_sum(index, self.deviation, len(position))
+        return self.frame(
+            {"position": position, "mutations": np.bincount(index), "count": count},
+            {"variance": (deviation.T / count).T,
+             "contribution": deviation / max(self.edges, 1)})
 
 
 class Ruggness:
@@ -19,43 +293,409 @@ class Ruggness:
         self.variables = self.meta.variables
         self.fitness = self.meta.fitness
 
-    def calculate(self) -> float:
+    def edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
         """
-        calculate ruggness of a scenery
+        edges counted by ruggness
 
         Returns
         -------
-        ruggness : float
-            ruggness of scenery
+        label, diff, source, target : Tuple[np.ndarray, ...]
+            mutation label and fitness difference of every edge, a row of
+            K differences for N x K fitness, and its variants
         """
-        mutation_label = [
-            f"{m}{n}{k}"
-            for m, n, k in product(
-                range(self.sequence_length), self.variables, self.variables
-            )
-            if n != k
-        ]
-        mutation_derivation: Dict[str, List[float]] = dict(
-            zip(mutation_label, [[] for _ in range(len(mutation_label))])
+        source = self.neighbour.source
+        # every unordered pair of neighbours counts once, from its smaller index
+        select = self.neighbour.target > source
+        source, target = source[select], self.neighbour.target[select]
+        diff_value = self.fitness[target] - self.fitness[source]
+        label = mutation_label(
+            self.neighbour.position[select],
+            self.neighbour.from_code[select],
+            self.neighbour.to_code[select],
+            len(self.variables),
         )
+        return label, diff_value, source, target
+
+    @metrics.staged("ruggness")
+    def calculate(self) -> Union[float, np.ndarray]:
+        """
+        calculate ruggness of a scenery, the neighbour graph and mutation
+        labels are shared by all columns of N x K fitness
+
+        Returns
+        -------
+        ruggness : Union[float, np.ndarray]
+            ruggness of scenery, of every fitness column for N x K fitness
+        """
+        label, diff_value, _, _ = self.edges()
+        return np.var(group_recenter(label, diff_value), axis=0)
+
+    @metrics.staged("ruggness")
+    def decompose(self) -> RuggnessDecomposition:
+        """
+        calculate ruggness of a scenery with its contribution of every
+        mutation and position, in the same pass over edges as `calculate`
+
+        Returns
+        -------
+        decomposition : RuggnessDecomposition
+            ruggness, and tables by `mutations` and `positions`
+        """
+        label, diff_value, _, _ = self.edges()
+        label_num = self.sequence_length * len(self.variables) ** 2
+        return RuggnessDecomposition(
+            np.bincount(label, minlength=label_num),
+            group_sum(label, diff_value, label_num),
+            group_sum(label, group_recenter(label, diff_value) ** 2, label_num),
+            self.meta.dictionary.alphabet, self.meta.fitness_labels)
+
+    @metrics.staged("ruggness")
+    def interval(
+        self,
+        replicates: int = 1000,
+        method: str = "bootstrap",
+        unit: str = "variant",
+        confidence: float = 0.95,
+        seed: int = 0,
+        n_jobs: int = 1,
+        backend: str = "loky",
+        column: Optional[int] = None,
+    ) -> RuggnessInterval:
+        """
+        calculate ruggness of a scenery with its uncertainty, every replicate
+        reweights edges of the neighbour graph instead of searching it again
+
+        Parameters
+        ----------
+        replicates: int
+            bootstrap replicates, ignored by jackknife which leaves out
+            every `unit` once
 
-        for i in range(self.sequence_length):
-            neighbour_of_one = self.neighbour[i]
-            items = filter(lambda x, index=i: x.target >
-                           index, neighbour_of_one)
-
-            for item in items:
-                mut_index = item.index[0]
-                diff_value = self.fitness[item.target] - self.fitness[i]
-                mutation_derivation[f"{mut_index}{item.diff}"].append(
-                    diff_value
-                )
-
-        mutation_derivation = {
-            key: value for key, value in mutation_derivation.items() if len(value) > 0
-        }
-        diff_recenter = []
-        for key in mutation_derivation.keys():
-            mean = np.mean(mutation_derivation[key])
-            diff_recenter.extend([v - mean for v in mutation_derivation[key]])
-        return np.var(diff_recenter)
+        method: str
+            one of `bootstrap`, replicates in batches of a weight matrix,
+            and `jackknife`, all replicates in a pass over edges
+
+        unit: str
+            one of `variant`, resampling sequences with their edges,
+            and `edge`, resampling neighbour pairs
+
+        confidence: float
+            coverage of the interval
+
+        seed: int
+            seed of bootstrap, replicates are the same for any `n_jobs`
+
+        n_jobs, backend: int, str
+            workers of bootstrap batches, see `Scheduler`
+
+        column: Optional[int]
+            fitness column of N x K fitness
+
+        Returns
+        -------
+        interval : RuggnessInterval
+            estimate, standard error, interval and replicates
+        """
+        assert method in RESAMPLE_METHODS, f"method should be one of {RESAMPLE_METHODS}"
+        assert unit in RESAMPLE_UNITS, f"unit should be one of {RESAMPLE_UNITS}"
+        assert 0.0 < confidence < 1.0, "confidence should be in (0, 1)"
+        label, diff_value, source, target = self.edges()
+        if column is not None:
+            diff_value = diff_value[:, column]
+        assert diff_value.ndim == 1, "column should be given for N x K fitness"
+        estimate = float(np.var(group_recenter(label, diff_value)))
+        _, group = np.unique(label, return_inverse=True)
+        group = group.reshape(-1)
+        centered = group_recenter(group, diff_value)
+        variant_num = len(self.fitness)
+
+        if method == "jackknife":
+            edge = np.arange(len(centered))
+            if unit == "variant":
+                values = delete_one(np.concatenate([source, target]),
+                                    np.concatenate([edge, edge]), variant_num,
+                                    group, centered)
+            else:
+                values = delete_one(edge, edge, len(edge), group, centered)
+            return RuggnessInterval(estimate, values, method, unit, confidence)
+
+        assert replicates > 1, "replicates should be more than 1"
+        # edges sorted by mutation, so that a mutation is a slice
+        order = np.argsort(group, kind="stable")
+        group_start = np.flatnonzero(np.diff(group[order], prepend=-1))
+        values = np.empty(replicates)
+        scheduler = Scheduler(n_jobs, backend=backend if n_jobs != 1 else "sequential")
+        results = scheduler.imap_unordered(
+            bootstrap_batch, list(range(replicates)),
+            group_start, centered[order], source[order], target[order],
+            variant_num, unit, seed, per_batch=True)
+        for replicate, value in results:
+            values[replicate] = value
+        return RuggnessInterval(estimate, values, method, unit, confidence)
+
+
+class MutationAccumulator:
+    """online count, mean and M2 of fitness difference of every mutation"""
+
+    def __init__(self, label_num: int, columns: Tuple[int, ...] = ()) -> None:
+        self.count = np.zeros(label_num)
+        # by column of values, for a batch of N x K values
+        self.mean = np.zeros((label_num,) + columns)
+        self.m2 = np.zeros((label_num,) + columns)
+
+    def batch(self, label: np.ndarray, value: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """count, mean and M2 of every mutation in a batch of labeled values"""
+        label_num = len(self.count)
+        count = np.bincount(label, minlength=label_num).astype(np.float64)
+        mean = (group_sum(label, value, label_num).T / np.maximum(count, 1)).T
+        m2 = group_sum(label, (value - mean[label]) ** 2, label_num)
+        return count, mean, m2
+
+    def update(self, label: np.ndarray, value: np.ndarray) -> None:
+        """merge a batch of labeled values, in the way of Chan et al."""
+        count, mean, m2 = self.batch(label, value)
+        total = self.count + count
+        delta = mean - self.mean
+        ratio = np.divide(count, total, out=np.zeros(len(count)),
+                          where=total > 0)
+        self.mean += (delta.T * ratio).T
+        self.m2 += m2 + (delta.T ** 2 * (self.count * ratio)).T
+        self.count = total
+
+    def remove(self, label: np.ndarray, value: np.ndarray) -> None:
+        """take out a batch of labeled values merged before, reversing `update`"""
+        count, mean, m2 = self.batch(label, value)
+        rest = self.count - count
+        delta = self.mean - mean
+        # removed count over kept count, 0 for a mutation left without values
+        ratio = np.divide(count, rest, out=np.zeros(len(count)), where=rest > 0)
+        m2 = self.m2 - m2 - (delta.T ** 2 * (self.count * ratio)).T
+        self.mean = ((self.mean + (delta.T * ratio).T).T * (rest > 0)).T
+        # M2 is never negative besides rounding
+        self.m2 = (np.maximum(m2, 0.0).T * (rest > 0)).T
+        self.count = rest
+
+    def variance(self) -> Union[float, np.ndarray]:
+        """variance of all values, each recentered to its mutation mean"""
+        return self.m2.sum(axis=0) / self.count.sum()
+
+    def decompose(
+        self, alphabet: str, fitness_labels: Optional[List[str]],
+    ) -> RuggnessDecomposition:
+        """contribution of every mutation and position to the variance"""
+        return RuggnessDecomposition(
+            self.count, (self.mean.T * self.count).T, self.m2, alphabet, fitness_labels)
+
+
+class IncrementalRuggness(Ruggness):
+    """
+    Cauculation of dataset Ruggness kept up to date while variants are
+    added, removed or corrected, by count, mean and M2 of fitness difference
+    of every mutation, only edges touching changed sequences are accounted again,
+    so that an update costs by their neighbours instead of the dataset
+    """
+
+    def __init__(self, meta: MetaData) -> None:
+        super().__init__(meta)
+        self.accumulator = MutationAccumulator(
+            self.sequence_length * len(self.variables) ** 2, self.fitness.shape[1:])
+        label, diff_value, _, _ = self.edges()
+        self.accumulator.update(label, diff_value)
+
+    def refresh(self) -> None:
+        """read the updated dataset"""
+        self.neighbour = self.meta.neighbour
+        self.fitness = self.meta.fitness
+
+    def touching(self, member: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        edges counted by ruggness touching `member` sequences, every edge once
+
+        Returns
+        -------
+        label, diff : Tuple[np.ndarray, np.ndarray]
+            mutation label and fitness difference of every edge
+        """
+        rows = np.flatnonzero(member)
+        indptr = self.neighbour.indptr
+        degree = indptr[rows + 1] - indptr[rows]
+        edges = np.repeat(indptr[rows], degree) + (
+            np.arange(degree.sum()) - np.repeat(np.cumsum(degree) - degree, degree))
+        own = np.repeat(rows, degree)
+        other = self.neighbour.target[edges]
+        # an edge between members once, from the smaller one
+        once = ~member[other] | (own < other)
+        own, other, edges = own[once], other[once], edges[once]
+        source, target = np.minimum(own, other), np.maximum(own, other)
+        forward = own == source
+        from_code = self.neighbour.from_code[edges]
+        to_code = self.neighbour.to_code[edges]
+        label = mutation_label(
+            self.neighbour.position[edges],
+            np.where(forward, from_code, to_code),
+            np.where(forward, to_code, from_code),
+            len(self.variables),
+        )
+        return label, self.fitness[target] - self.fitness[source]
+
+    def add_variants(
+        self, sequences: List[str], fitness: Union[List[float], np.ndarray],
+    ) -> np.ndarray:
+        """append new sequences, see `MetaData.add_variants`"""
+        index = self.meta.add_variants(sequences, fitness)
+        self.refresh()
+        member = np.zeros(self.meta.sequence_num, dtype=bool)
+        member[index] = True
+        self.accumulator.update(*self.touching(member))
+        return index
+
+    def remove_variants(self, sequences: List[str]) -> np.ndarray:
+        """remove sequences, see `MetaData.remove_variants`"""
+        removed = np.zeros(self.meta.sequence_num, dtype=bool)
+        removed[self.meta.index_of(sequences)] = True
+        self.accumulator.remove(*self.touching(removed))
+        keep = self.meta.remove_variants(sequences)
+        self.refresh()
+        return keep
+
+    def update_fitness(
+        self, sequences: List[str], fitness: Union[List[float], np.ndarray],
+    ) -> np.ndarray:
+        """correct fitness of sequences, see `MetaData.update_fitness`"""
+        member = np.zeros(self.meta.sequence_num, dtype=bool)
+        member[self.meta.index_of(sequences)] = True
+        self.accumulator.remove(*self.touching(member))
+        index = self.meta.update_fitness(sequences, fitness)
+        self.refresh()
+        self.accumulator.update(*self.touching(member))
+        return index
+
+    @metrics.staged("ruggness")
+    def calculate(self) -> Union[float, np.ndarray]:
+        """
+        calculate ruggness of a scenery from the accumulator of every mutation
+
+        Returns
+        -------
+        ruggness : Union[float, np.ndarray]
+            ruggness of scenery, of every fitness column for N x K fitness
+        """
+        return self.accumulator.variance()
+
+    @metrics.staged("ruggness")
+    def decompose(self) -> RuggnessDecomposition:
+        """
+        ruggness of a scenery with its contribution of every mutation and
+        position, from the accumulator of every mutation
+
+        Returns
+        -------
+        decomposition : RuggnessDecomposition
+            ruggness, and tables by `mutations` and `positions`
+        """
+        return self.accumulator.decompose(
+            self.meta.dictionary.alphabet, self.meta.fitness_labels)
+
+
+class StreamRuggness:
+    """
+    Cauculation of dataset Ruggness over successive chunks of a dataset,
+    holding an index of seen sequences and their fitness instead of the
+    parsed dataset and its neighbour graph, every pair of neighbours is
+    counted once, when its later sequence is read
+    """
+
+    def __init__(
+        self, chunks: Iterable[Scenery], chars: Union[List[str], str],
+        progress: Progress = NO_PROGRESS,
+    ) -> None:
+        self.chunks = chunks
+        self.dictionary = Dictionary.from_factory(chars)
+        # advanced chunk by chunk, of unknown total
+        self.progress = progress
+
+        # index of every seen sequence, sequences are expected to be
+        # distinct, a repeated one is paired by its first row
+        self.seq_index: Dict[bytes, int] = {}
+        self.fitness = np.zeros(0)
+        self.seen = 0
+        self.accumulator: Optional[MutationAccumulator] = None
+        # names of K fitness columns, read from chunks
+        self.fitness_labels: Optional[List[str]] = None
+
+    @classmethod
+    def from_csv(
+        cls, path: str, args: SeqArgs, chars: Union[List[str], str],
+        chunksize: int = 100000, progress: Progress = NO_PROGRESS,
+    ) -> StreamRuggness:
+        """stream a `sequence` format csv file or a binary dataset"""
+        if BinParser.is_dataset(path):
+            return cls(BinParser.iter_parse(path, chunksize), chars, progress)
+        return cls(SeqParser.iter_parse(path, args, chunksize), chars, progress)
+
+    def update(self, scenery: Scenery) -> None:
+        """
+        account all pairs between a chunk and earlier sequences, found by
+        looking up substitutions of the chunk in the index, see `single_mutants`
+        """
+        matrix = self.dictionary.encode_scenery(scenery)
+        fitness = np.asarray(scenery.fitness, dtype=np.float64)
+        sequence_length = matrix.shape[1]
+        variable_num = len(self.dictionary.alphabet)
+        if self.accumulator is None:
+            self.fitness = np.zeros((0,) + fitness.shape[1:])
+            self.accumulator = MutationAccumulator(
+                sequence_length * variable_num ** 2, fitness.shape[1:])
+            self.fitness_labels = scenery.fitness_labels
+
+        # pairs inside the chunk are found by indexing it first
+        begin = self.seen
+        for index, key in enumerate(row_keys(matrix), begin):
+            self.seq_index.setdefault(key, index)
+        self.fitness = np.concatenate([self.fitness, fitness])
+        self.seen += len(matrix)
+
+        row, target, position, from_code, to_code = single_mutants(
+            matrix, np.arange(sequence_length), variable_num, self.seq_index)
+        # a pair once, from its earlier sequence, whose code is the substitute
+        select = target < row + begin
+        row, target = row[select], target[select]
+        self.accumulator.update(
+            mutation_label(position[select], to_code[select], from_code[select],
+                           variable_num),
+            fitness[row] - self.fitness[target],
+        )
+
+    @metrics.staged("ruggness")
+    def calculate(self) -> Union[float, np.ndarray]:
+        """
+        calculate ruggness of a scenery, chunk by chunk
+
+        Returns
+        -------
+        ruggness : Union[float, np.ndarray]
+            ruggness of scenery, of every fitness column for N x K fitness
+        """
+        self.progress.start("streaming ruggness")
+        for scenery in self.chunks:
+            self.update(scenery)
+            self.progress.advance("streaming ruggness")
+        self.progress.finish("streaming ruggness")
+        assert self.accumulator is not None, "no sequence in dataset"
+        return self.accumulator.variance()
+
+    def decompose(self) -> RuggnessDecomposition:
+        """
+        ruggness of a scenery with its contribution of every mutation and
+        position, from the accumulator of `calculate`, chunks are read
+        only if ruggness is not calculated yet
+
+        Returns
+        -------
+        decomposition : RuggnessDecomposition
+            ruggness, and tables by `mutations` and `positions`
+        """
+        if self.accumulator is None:
+            self.calculate()
+        assert self.accumulator is not None, "no sequence in dataset"
+        return self.accumulator.decompose(self.dictionary.alphabet, self.fitness_labels)
@@ -0,0 +1,177 @@
+"""scheduler of independent tasks over a bounded pool of workers"""
+import os
+from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Optional, Sequence, Tuple, Union
+
+if TYPE_CHECKING:
+    from joblib import Parallel
+
+BACKENDS = ("loky", "threading", "sequential")
+
+
+def run_batch(func: Callable, batch: Sequence[Any], shared: tuple) -> List[Any]:
+    """run a batch of tasks inside one worker"""
+    return [func(item, *shared) for item in batch]
+
+
+def run_pair_batch(
+    func: Callable, batch: Sequence[Any], shared: tuple, per_batch: bool
+) -> List[Tuple[Any, Any]]:
+    """
+    run a batch of tasks inside one worker, pairing items with results,
+    `func` takes the whole batch and returns its results if `per_batch`
+    """
+    results = func(batch, *shared) if per_batch else run_batch(func, batch, shared)
+    return list(zip(batch, results))
+
+
+class Scheduler:
+    """
+    run a function over many items with a bounded number of workers,
+    several items per task
+
+    Parameters
+    ----------
+    n_jobs: int
+        number of workers, negative value counts back from cpu number,
+        as -1 for all cpus
+
+    batch_size: int
+        items of a task, 0 for spliting items into about
+        `tasks_per_worker` tasks per worker
+
+    backend: str
+        one of `loky` for processes, `threading` for threads
+        and `sequential` for running in the calling process
+
+    max_nbytes: Union[int, str, None]
+        shared arrays larger than it are memory-mapped into workers
+        instead of being copied, None to always copy
+
+    pre_dispatch: Union[int, str]
+        tasks dispatched ahead of free workers, which caps the memory
+        held by pending tasks on the driver
+
+    tasks_per_worker: int
+        tasks of every worker when `batch_size` is 0
+    """
+
+    def __init__(
+        self,
+        n_jobs: int = -1,
+        batch_size: int = 0,
+        backend: str = "loky",
+        max_nbytes: Union[int, str, None] = "1M",
+        pre_dispatch: Union[int, str] = "n_jobs",
+        tasks_per_worker: int = 4,
+    ) -> None:
+        assert backend in BACKENDS, f"backend should be one of {BACKENDS}"
+        assert n_jobs != 0, "n_jobs should not be 0"
+        assert batch_size >= 0, "batch_size should not be negative"
+        self.n_jobs = n_jobs
+        self.batch_size = batch_size
+        self.backend = backend
+        self.max_nbytes = max_nbytes
+        self.pre_dispatch = pre_dispatch
+        self.tasks_per_worker = tasks_per_worker
+
+    @property
+    def workers(self) -> int:
+        """number of workers actually used"""
+        if self.backend == "sequential":
+            return 1
+        cpus = os.cpu_count() or 1
+        if self.n_jobs < 0:
+            return max(cpus + 1 + self.n_jobs, 1)
+        return self.n_jobs
+
+    def batches(
+        self, items: Sequence[Any], group: Optional[Callable] = None
+    ) -> List[Sequence[Any]]:
+        """
+        split items into tasks, a task never mixes items of different
+        `group(item)` when items of a group are adjacent
+        """
+        runs: List[Sequence[Any]] = []
+        begin = 0
+        for i in range(1, len(items) + 1):
+            if i == len(items) or (
+                    group is not None and group(items[i]) != group(items[begin])):
+                runs.append(items[begin:i])
+                begin = i
+        batches: List[Sequence[Any]] = []
+        for run in runs:
+            batch_size = self.batch_size
+            if batch_size == 0:
+                batch_size = max(
+                    -(-len(run) // (self.workers * self.tasks_per_worker)), 1)
+            batches.extend(run[i:i + batch_size]
+                           for i in range(0, len(run), batch_size))
+        return batches
+
+    def parallel(self, tasks: int, return_as: str = "list") -> Optional["Parallel"]:
+        """
+        pool of workers for some tasks, None when running sequentially,
+        joblib is only imported once a pool is needed
+        """
+        workers = min(self.workers, tasks)
+        if workers <= 1:
+            return None
+        # pylint: disable=import-outside-toplevel
+        from joblib import Parallel
+        return Parallel(
+            n_jobs=workers,
+            backend=self.backend,
+            max_nbytes=self.max_nbytes,
+            mmap_mode="r",
+            pre_dispatch=self.pre_dispatch,
+            return_as=return_as,
+        )
+
+    def map(self, func: Callable, items: Sequence[Any], *shared: Any) -> List[Any]:
+        """
+        calculate `func(item, *shared)` for every item, in order of items
+
+        `shared` are sent once per task, large arrays among them are
+        memory-mapped read-only for process workers
+        """
+        batches = self.batches(items)
+        parallel = self.parallel(len(batches))
+        if parallel is None:
+            results = [run_batch(func, batch, shared) for batch in batches]
+        else:
+            # pylint: disable=import-outside-toplevel
+            from joblib import delayed
+            results = parallel(
+                delayed(run_batch)(func, batch, shared) for batch in batches)
+        return [one for batch in results for one in batch]
+
+    def imap_unordered(
+        self,
+        func: Callable,
+        items: Sequence[Any],
+        *shared: Any,
+        group: Optional[Callable] = None,
+        per_batch: bool = False,
+        done: Optional[Callable[[Sequence[Any]], None]] = None,
+    ) -> Iterator[Tuple[Any, Any]]:
+        """
+        generate `(item, func(item, *shared))` for every item,
+        batch by batch as soon as a batch is finished,
+        `func(batch, *shared)` returns results of a whole batch if `per_batch`,
+        `done(batch)` is called in the calling process once a batch is finished
+        """
+        batches = self.batches(items, group)
+        parallel = self.parallel(len(batches), "generator_unordered")
+        if parallel is None:
+            results = (run_pair_batch(func, batch, shared, per_batch)
+                       for batch in batches)
+        else:
+            # pylint: disable=import-outside-toplevel
+            from joblib import delayed
+            results = parallel(
+                delayed(run_pair_batch)(func, batch, shared, per_batch)
+                for batch in batches)
+        for batch in results:
+            if done is not None:
+                done([item for item, _ in batch])
+            yield from batch
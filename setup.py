@@ -13,10 +13,9 @@ REQUIRES_PYTHON = '>=3.6.0'
 VERSION = '1.0'
 REQUIRED = [
     "pandas>=1.3.4",
-    "networkx>=2.6.3",
     "matplotlib>=3.4.3",
     "numpy>=1.20.3",
-    "joblib>=1.1.0",
+    "joblib>=1.4.0",
     "tqdm>=4.62.2",
     "click>=8.0.3"
 ]
@@ -1 +1,17 @@
 """nothing"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cliff.cache import CACHE_DIR_ENV
+
+
+def isolate_cache(case: unittest.TestCase) -> None:
+    """point the neighbour cache at a directory removed after the test"""
+    folder = tempfile.mkdtemp()
+    case.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+    environ = mock.patch.dict(os.environ, {CACHE_DIR_ENV: folder})
+    environ.start()
+    case.addCleanup(environ.stop)
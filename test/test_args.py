@@ -1,15 +1,48 @@
 """do the unit test of the argument client."""
 
+import json
+import os
+import subprocess
+import sys
 import unittest
-from os.path import join, dirname
+from os.path import join, dirname, exists
+from tempfile import TemporaryDirectory
 
+import pandas as pd
 from click.testing import CliRunner
-from cliff.client import rug_mut, rug_seq, epi_mut, epi_seq
+from cliff.client import rug_mut, rug_seq, epi_mut, epi_seq, convert, bench
+
+from . import isolate_cache
+
+
+# cumulative microseconds of importing `cliff.client`
+IMPORT_BUDGET = 300000
 
 
 class TestArgCall(unittest.TestCase):
     """do the unit test of the argument client."""
 
+    def setUp(self):
+        """point the neighbour cache at a directory of the test"""
+        isolate_cache(self)
+
+    def test_import_time(self):
+        """test the client starts without importing the scientific stack"""
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import cliff.client'],
+            cwd=join(dirname(__file__), '..'), capture_output=True, text=True, check=True)
+        # lines of `import time: self [us] | cumulative | imported package`
+        cumulative = {}
+        for line in result.stderr.splitlines()[1:]:
+            if not line.startswith('import time:'):
+                continue
+            _, total, name = line.split(':', 1)[1].split('|')
+            cumulative[name.strip()] = int(total)
+
+        for heavy in ['numpy', 'pandas', 'matplotlib', 'joblib', 'tqdm']:
+            self.assertNotIn(heavy, cumulative)
+        self.assertLess(cumulative['cliff.client'], IMPORT_BUDGET)
+
     def test_rug_mut(self):
         """test calculate a ruggness on mutation format dataset"""
         path = join(dirname(__file__), "data/mut.csv")
@@ -33,6 +66,61 @@ class TestArgCall(unittest.TestCase):
         self.assertEqual(result.exception, None)
         self.assertEqual(result.exit_code, 0)
 
+    def test_rug_interval(self):
+        """test calculate a ruggness with its confidence interval"""
+        path = join(dirname(__file__), "data/seq.csv")
+
+        runner = CliRunner()
+        for extra in [['--bootstrap', '50'], ['--jackknife', '--unit', 'edge']]:
+            result = runner.invoke(
+                rug_seq, [path, '-s', 'Sequence', '-f', 'Fitness', '-c', 'ABCDEFGHIKL'] + extra)
+
+            self.assertEqual(result.exception, None)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("95% interval", result.output)
+
+    def test_rug_decompose(self):
+        """test write contributions of positions and mutations to ruggness"""
+        path = join(dirname(__file__), "data/seq.csv")
+
+        runner = CliRunner()
+        expect = runner.invoke(rug_seq, [path, '-s', 'Sequence', '-f', 'Fitness',
+                                         '-c', 'ABCDEFGHIKL'])
+        for extra in [[], ['--stream', '--chunksize', '10']]:
+            with TemporaryDirectory() as folder:
+                by_position = join(folder, "position.csv")
+                by_mutation = join(folder, "mutation.csv")
+                result = runner.invoke(
+                    rug_seq, [path, '-s', 'Sequence', '-f', 'Fitness', '-c', 'ABCDEFGHIKL',
+                              '--by-position', by_position, '--by-mutation', by_mutation] + extra)
+
+                self.assertEqual(result.exception, None)
+                self.assertEqual(result.exit_code, 0)
+                rug = float(result.output.split("Ruggness: ")[1].split()[0])
+                self.assertAlmostEqual(
+                    rug, float(expect.output.split("Ruggness: ")[1].split()[0]))
+                self.assertAlmostEqual(pd.read_csv(by_position)["contribution"].sum(), rug)
+                self.assertAlmostEqual(pd.read_csv(by_mutation)["contribution"].sum(), rug)
+
+    def test_rug_seq_stream(self):
+        """test calculate a ruggness on sequence format dataset by chunks"""
+        path = join(dirname(__file__), "data/seq.csv")
+
+        runner = CliRunner()
+        result = runner.invoke(
+            rug_seq, [path, '-s', 'Sequence', '-f', 'Fitness', '-c', 'ABCDEFGHIKL',
+                      '--stream', '--chunksize', '10'])
+
+        self.assertEqual(result.exception, None)
+        self.assertEqual(result.exit_code, 0)
+
+        for extra in [['--bootstrap', '10'], ['--jackknife']]:
+            result = runner.invoke(
+                rug_seq, [path, '-s', 'Sequence', '-f', 'Fitness', '-c', 'ABCDEFGHIKL',
+                          '--stream'] + extra)
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn("not available with --stream", result.output)
+
     def test_epi_mut(self):
         """test calculate a epistasis on mutation format dataset"""
         path = join(dirname(__file__), "data/mut.csv")
@@ -51,7 +139,97 @@ class TestArgCall(unittest.TestCase):
 
         runner = CliRunner()
         result = runner.invoke(
-            epi_seq, [path, '-s', 'Sequence', '-f', 'Fitness', '-o', '1', '-c', 'ABCDEFGHIKL'])
+            epi_seq, [path, '-s', 'Sequence', '-f', 'Fitness', '-o', '1', '-c', 'ABCDEFGHIKL',
+                      '-j', '2'])
 
         self.assertEqual(result.exception, None)
         self.assertEqual(result.exit_code, 0)
+
+    def test_epi_seq_no_key(self):
+        """test epistasis without any residue key skips its plot"""
+        runner = CliRunner()
+        cwd = os.getcwd()
+        with TemporaryDirectory() as folder:
+            os.chdir(folder)
+            try:
+                pd.DataFrame({"Sequence": ["AAA"], "Fitness": [0.1]}).to_csv(
+                    "seq.csv", index=False)
+                result = runner.invoke(
+                    epi_seq, ['seq.csv', '-s', 'Sequence', '-f', 'Fitness', '-o', '2',
+                              '-c', 'AT', '-j', '1'])
+                plotted = exists("output.png")
+            finally:
+                os.chdir(cwd)
+
+        self.assertEqual(result.exception, None)
+        self.assertIn("skipped", result.output)
+        self.assertFalse(plotted)
+
+    def test_convert(self):
+        """test convert a dataset into binary and calculate on it"""
+        path = join(dirname(__file__), "data/seq.csv")
+
+        runner = CliRunner()
+        with TemporaryDirectory() as folder:
+            output = join(folder, "seq.cliff")
+            result = runner.invoke(
+                convert, [path, output, '-s', 'Sequence', '-f', 'Fitness', '-c', 'ABCDEFGHIKL'])
+            self.assertEqual(result.exception, None)
+            self.assertEqual(result.exit_code, 0)
+
+            expect = runner.invoke(rug_seq, [path, '-s', 'Sequence', '-f', 'Fitness',
+                                             '-c', 'ABCDEFGHIKL'])
+            for extra in ([], ['--stream', '--chunksize', '10']):
+                result = runner.invoke(rug_seq, [output, '-c', 'ABCDEFGHIKL'] + extra)
+                self.assertEqual(result.exception, None)
+                self.assertAlmostEqual(
+                    float(result.output.split()[-1]), float(expect.output.split()[-1]))
+
+    def test_multi_fitness(self):
+        """test calculate a ruggness of every fitness column"""
+        data = pd.read_csv(join(dirname(__file__), "data/seq.csv"))
+        data["Double"] = data["Fitness"] * 2
+
+        runner = CliRunner()
+        with TemporaryDirectory() as folder:
+            path = join(folder, "seq.csv")
+            data.to_csv(path, index=False)
+            result = runner.invoke(
+                rug_seq, [path, '-s', 'Sequence', '-f', 'Fitness', '-f', 'Double',
+                          '-c', 'ABCDEFGHIKL', '--jackknife'])
+
+        self.assertEqual(result.exception, None)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("Ruggness [Double]", result.output)
+        self.assertIn("95% interval [Fitness]", result.output)
+
+    def test_bench(self):
+        """test benchmark synthetic landscapes into json records"""
+        runner = CliRunner()
+        with TemporaryDirectory() as folder:
+            output = join(folder, "bench.json")
+            result = runner.invoke(
+                bench, ['-l', '3', '-l', '4', '-a', '2', '-r', '1', '--output', output])
+            self.assertEqual(result.exception, None)
+            self.assertEqual(result.exit_code, 0)
+            with open(output, encoding="utf-8") as file:
+                records = json.load(file)
+        self.assertEqual({record["sequence_length"] for record in records}, {3, 4})
+
+    def test_profile(self):
+        """test write a profile of stages of a command"""
+        path = join(dirname(__file__), "data/seq.csv")
+
+        runner = CliRunner()
+        with TemporaryDirectory() as folder:
+            output = join(folder, "profile.json")
+            result = runner.invoke(
+                rug_seq, [path, '-s', 'Sequence', '-f', 'Fitness', '-c', 'ABCDEFGHIKL',
+                          '--profile', output, '--progress', 'log'])
+            self.assertEqual(result.exception, None)
+            self.assertEqual(result.exit_code, 0)
+            with open(output, encoding="utf-8") as file:
+                report = json.load(file)
+        for name in ["parse", "encode", "neighbour", "ruggness"]:
+            self.assertEqual(report["stages"][name]["calls"], 1)
+        self.assertGreater(report["counters"]["neighbour.edges"], 0)
@@ -1,15 +1,35 @@
 """do the unit test of the API calling."""
 
+import itertools
+import os
 import unittest
 from os.path import join, dirname
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pandas as pd
 
 from cliff import Ruggness, MetaData, Epistasis
-from cliff.parser import SeqArgs, SeqParser, MutArgs, MutParser, Scenery
+from cliff.bench import BenchCase, run_case, synthetic_scenery
+from cliff.cache import NeighbourCache
+from cliff import metrics
+from cliff.progress import LogProgress, Progress
+from cliff.ruggness import IncrementalRuggness, StreamRuggness, group_recenter
+from cliff.epi_utils import EpiTable, KeyIndex, KeySupport, get_epi_from_diff, subset_columns
+from cliff.epistasis import key_system, select_column
+from cliff.metadata import MutationSet
+from cliff.parser import BinParser, SeqArgs, SeqParser, MutArgs, MutParser, Scenery
+
+from . import isolate_cache
 
 
-class TestLibCall(unittest.TestCase):
+class TestLibCall(unittest.TestCase):  # pylint: disable=too-many-public-methods
     """do the unit test of the API calling."""
 
+    def setUp(self):
+        """point the neighbour cache at a directory of the test"""
+        isolate_cache(self)
+
     def test_load_sequence(self):
         """test load a sequence format csv"""
         args = SeqArgs()
@@ -36,6 +56,65 @@ class TestLibCall(unittest.TestCase):
         mean = sum(scenery.fitness) / len(scenery.fitness)
         self.assertAlmostEqual(mean, 0.4625, places=3)
 
+    def test_load_mutation_repeated(self):
+        """test a residue mutated twice in one line is rejected"""
+        for line in ["A1T:A1C", "A1T:A2C:T1C"]:
+            with self.assertRaises(AssertionError):
+                MutParser.encode_mut_seq(pd.Series(["A2T", line]), "AAA", 0)
+
+    def test_load_mutation_chunks(self):
+        """test load a mutation format csv chunk by chunk in processes"""
+        args = MutArgs()
+        args.fitness_label = "score"
+        args.mutation_label = "variant"
+        args.vt_offset = 0
+        args.wile_type = "AAA"
+
+        path = join(dirname(__file__), "data/mut.csv")
+        whole = MutParser.parse(path, args)
+        args.chunksize = 3
+        args.n_jobs = 2
+        chunks = MutParser.parse(path, args)
+
+        self.assertEqual(chunks.sequence, whole.sequence)
+        self.assertEqual(chunks.fitness, whole.fitness)
+        for one, other in zip(chunks.mutations, whole.mutations):
+            np.testing.assert_array_equal(one, other)
+        self.assertEqual(whole.sequence, [
+            MutParser.generate_mut_seq(line, "AAA", 0)
+            for line in pd.read_csv(path)["variant"].fillna("")])
+
+        # a file of only a header is an empty dataset, read whole or by chunks
+        with TemporaryDirectory() as folder:
+            header = join(folder, "header.csv")
+            pd.DataFrame(columns=["variant", "score"]).to_csv(header, index=False)
+            for chunksize in [0, 3]:
+                args.chunksize = chunksize
+                empty = MutParser.parse(header, args)
+                self.assertEqual(empty.matrix.shape, (0, 3))
+                self.assertEqual(list(empty.fitness), [])
+
+    def test_load_binary(self):
+        """test save and load a binary dataset"""
+        args = MutArgs()
+        args.fitness_label = "score"
+        args.mutation_label = "variant"
+        args.vt_offset = 0
+        args.wile_type = "AAA"
+
+        path = join(dirname(__file__), "data/mut.csv")
+        meta = MetaData(MutParser.parse(path, args), "AT", cache=False)
+        with TemporaryDirectory() as folder:
+            meta.save(join(folder, "mut.cliff"))
+            scenery = MutParser.parse(join(folder, "mut.cliff"), args)
+
+            self.assertIsInstance(scenery.matrix, np.memmap)
+            self.assertEqual(scenery.sequence[1], "AAT")
+            self.assertAlmostEqual(
+                sum(scenery.fitness) / len(scenery.fitness), 0.4625, places=3)
+            rug = Ruggness(MetaData(scenery, "TA", cache=False)).calculate()
+            self.assertAlmostEqual(rug, Ruggness(meta).calculate())
+
     def test_calculate_rug(self):
         """test calculate ruggness"""
         chars = list("AT")
@@ -51,7 +130,340 @@ class TestLibCall(unittest.TestCase):
         calculator = Ruggness(meta)
         rug = calculator.calculate()
 
-        self.assertAlmostEqual(rug, 0.0095, places=3)
+        self.assertAlmostEqual(rug, 0.0252, places=3)
+
+    def test_unknown_chars(self):
+        """test residues out of variables form no substitution"""
+        cube = ["AAA", "AAT", "ATA", "TAA", "ATT", "TAT", "TTA", "TTT"]
+        fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0]
+
+        def calculators(sequence, values, chars="AT"):
+            scenery = Scenery()
+            scenery.sequence = sequence
+            scenery.fitness = values
+            meta = MetaData(scenery, chars, cache=False)
+            meta.get_neighbour(tqdm_enable=False)
+            return (Ruggness(meta), StreamRuggness([scenery], chars),
+                    Epistasis(scenery, 3, chars, backend="sequential", cache=False))
+
+        expect, _, expect_epi = calculators(cube, fitness)
+        # a constant residue out of variables
+        for calculator in calculators([seq[0] + "X" + seq[1:] for seq in cube], fitness)[:2]:
+            self.assertAlmostEqual(calculator.calculate(), expect.calculate())
+        # variants out of variables at a varied residue have no neighbour there
+        rug, stream, epi = calculators(cube + ["XAA", "ATX"], fitness + [5.0, 7.0])
+        self.assertAlmostEqual(rug.calculate(), expect.calculate())
+        self.assertAlmostEqual(stream.calculate(), expect.calculate())
+        self.assertEqual(epi.calculate(), expect_epi.calculate())
+
+        # a wild-type and a stop variant out of the default alphabet
+        args = MutArgs()
+        args.mutation_label = "variant"
+        args.fitness_label = "score"
+        args.wile_type = "AXAA"
+        args.vt_offset = 0
+        data = pd.DataFrame({
+            "variant": ["", "A4T", "A3T", "A1T", "A3T:A4T", "A1T:A4T", "A1T:A3T",
+                        "A1T:A3T:A4T", "A4*"],
+            "score": fitness + [9.0]})
+        meta = MetaData(MutParser.parse(data, args), "ACDEFGHIKLMNPQRSTVWY", cache=False)
+        meta.get_neighbour(tqdm_enable=False)
+        self.assertAlmostEqual(Ruggness(meta).calculate(), expect.calculate())
+
+    def test_epi_draw_no_key(self):
+        """test plotting epistasis of no residue key is rejected"""
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "ATA", "TAA"]
+        scenery.fitness = [0.1, 0.2, 0.3, 0.4]
+        calculator = Epistasis(scenery, 2, "AT", backend="sequential", cache=False,
+                               min_support=10)
+        epi = calculator.calculate()
+        self.assertEqual(epi, {})
+        with self.assertRaisesRegex(AssertionError, "no residue key"):
+            calculator.to_draw(epi)
+
+    def test_rug_interval(self):
+        """test bootstrap and jackknife interval of ruggness"""
+        scenery = synthetic_scenery(6, 3, missing=0.3, seed=1)
+        meta = MetaData(scenery, scenery.alphabet, cache=False)
+        meta.get_neighbour(tqdm_enable=False)
+        calculator = Ruggness(meta)
+        rug = calculator.calculate()
+        label, diff, source, target = calculator.edges()
+
+        for unit in ["variant", "edge"]:
+            interval = calculator.interval(method="jackknife", unit=unit)
+            self.assertAlmostEqual(interval.estimate, rug)
+            # every replicate equals ruggness without the left out unit
+            for left in range(3):
+                keep = ((source != left) & (target != left) if unit == "variant"
+                        else np.arange(len(label)) != left)
+                self.assertAlmostEqual(interval.replicates[left],
+                                       np.var(group_recenter(label[keep], diff[keep])))
+
+            interval = calculator.interval(200, unit=unit, seed=3)
+            self.assertLessEqual(interval.low, interval.high)
+            self.assertGreater(interval.std_error, 0)
+            np.testing.assert_array_equal(
+                interval.replicates,
+                calculator.interval(200, unit=unit, seed=3, n_jobs=2,
+                                    backend="threading").replicates)
+
+    def test_rug_decompose(self):
+        """test contributions of positions and mutations to ruggness"""
+        scenery = synthetic_scenery(5, 3, missing=0.3, seed=1)
+        meta = MetaData(scenery, scenery.alphabet, cache=False)
+        meta.get_neighbour(tqdm_enable=False)
+        calculator = Ruggness(meta)
+        decomposition = calculator.decompose()
+        mutations, positions = decomposition.mutations(), decomposition.positions()
+        self.assertAlmostEqual(decomposition.ruggness, calculator.calculate())
+        self.assertAlmostEqual(mutations["contribution"].sum(), calculator.calculate())
+        self.assertAlmostEqual(positions["contribution"].sum(), calculator.calculate())
+
+        # a position is the ruggness of its own edges, weighted by their share
+        label, diff, _, _ = calculator.edges()
+        at = label // len(scenery.alphabet) ** 2
+        for row in positions.itertuples():
+            select = at == row.position
+            self.assertEqual(row.count, select.sum())
+            self.assertAlmostEqual(
+                row.variance, np.var(group_recenter(label[select], diff[select])))
+            self.assertAlmostEqual(row.contribution, row.variance * row.count / len(label))
+
+        # the same tables from sums of incremental and streamed ruggness
+        for other in [IncrementalRuggness(meta), StreamRuggness([scenery], scenery.alphabet)]:
+            pd.testing.assert_frame_equal(other.decompose().mutations(), mutations)
+            pd.testing.assert_frame_equal(other.decompose().positions(), positions)
+
+    def test_multi_fitness(self):
+        """test ruggness and epistasis of every fitness column in one pass"""
+        data = pd.DataFrame({
+            "Sequence": ["AAA", "AAT", "ATA", "TAA", "ATT", "TAT", "TTA", "TTT"],
+            "Fitness": [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0],
+            "Other": [0.5, 0.1, 0.9, 0.2, 0.7, 0.3, 0.4, 0.6],
+        })
+        args = SeqArgs()
+        args.sequence_label = "Sequence"
+        args.fitness_label = ["Fitness", "Other"]
+        scenery = SeqParser.parse(data, args)
+        self.assertEqual(scenery.fitness.shape, (8, 2))
+
+        singles = []
+        for label in args.fitness_label:
+            single = Scenery()
+            single.sequence = data["Sequence"].to_list()
+            single.fitness = data[label].to_list()
+            singles.append(single)
+
+        meta = MetaData(scenery, "AT", cache=False)
+        rug = Ruggness(meta).calculate()
+        for column, single in enumerate(singles):
+            self.assertAlmostEqual(
+                rug[column], Ruggness(MetaData(single, "AT", cache=False)).calculate())
+        for solver in ["tree", "lsq"]:
+            calculator = Epistasis(scenery, 3, "AT", backend="sequential", cache=False,
+                                   solver=solver)
+            epi = calculator.calculate()
+            with self.assertRaises(AssertionError):
+                calculator.to_draw(epi)
+            for column, single in enumerate(singles):
+                expect = Epistasis(single, 3, "AT", backend="sequential", cache=False,
+                                   solver=solver).calculate()
+                for key, residue in select_column(epi, column).items():
+                    for seq, value in residue.items():
+                        self.assertAlmostEqual(value, expect[key][seq])
+
+        with TemporaryDirectory() as folder:
+            path = join(folder, "seq.cliff")
+            meta.save(path)
+            scenery = BinParser.parse(path)
+            self.assertEqual(scenery.fitness_labels, ["Fitness", "Other"])
+            rug_stream = StreamRuggness(BinParser.iter_parse(path, 3), "AT").calculate()
+        np.testing.assert_allclose(rug_stream, rug)
+
+    def test_stream_rug(self):
+        """test calculate ruggness chunk by chunk"""
+        data = pd.DataFrame({
+            "Sequence": ["AAA", "AAT", "ATA", "TAA", "ATT", "TAT", "TTA", "TTT"],
+            "Fitness": [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0],
+        })
+        args = SeqArgs()
+        args.fitness_label = "Fitness"
+        args.sequence_label = "Sequence"
+
+        with TemporaryDirectory() as folder:
+            path = join(folder, "seq.csv")
+            data.to_csv(path, index=False)
+            rug = StreamRuggness.from_csv(path, args, "AT", 3).calculate()
+
+        self.assertAlmostEqual(rug, 0.0252, places=3)
+
+        # pairs of every chunk with all earlier chunks, not only the first rows
+        scenery = synthetic_scenery(5, 3, missing=0.3, seed=2)
+        meta = MetaData(scenery, scenery.alphabet, cache=False)
+        meta.get_neighbour(tqdm_enable=False)
+        parts = []
+        for begin in range(0, len(scenery.matrix), 7):
+            part = Scenery()
+            part.alphabet = scenery.alphabet
+            part.matrix = scenery.matrix[begin:begin + 7]
+            part.fitness = scenery.fitness[begin:begin + 7]
+            parts.append(part)
+        self.assertAlmostEqual(StreamRuggness(parts, scenery.alphabet).calculate(),
+                               Ruggness(meta).calculate())
+
+    def test_add_variants(self):
+        """test incremental updates match a dataset built at once"""
+        scenery = synthetic_scenery(6, 2, missing=0.3, seed=5)
+        sequences, fitness = scenery.sequence, np.asarray(scenery.fitness)
+
+        def build(index):
+            part = Scenery()
+            part.sequence = [sequences[i] for i in index]
+            part.fitness = fitness[index]
+            meta = MetaData(part, "AC", cache=False)
+            meta.get_neighbour(tqdm_enable=False)
+            return meta
+
+        meta = build(list(range(10)))
+        calculator = IncrementalRuggness(meta)
+        calculator.add_variants(sequences[10:], fitness[10:])
+        expect = build(list(range(len(sequences))))
+        for name, array in meta.neighbour.arrays().items():
+            np.testing.assert_array_equal(array, expect.neighbour.arrays()[name])
+        self.assertEqual(meta.seq_index, expect.seq_index)
+        self.assertAlmostEqual(calculator.calculate(), Ruggness(expect).calculate())
+
+        removed = [sequences[i] for i in (0, 2, 20)]
+        calculator.remove_variants(removed)
+        calculator.update_fitness(sequences[3:5], [1.0, -1.0])
+        fitness[3:5] = [1.0, -1.0]
+        expect = build([i for i, seq in enumerate(sequences) if seq not in removed])
+        for name, array in meta.neighbour.arrays().items():
+            np.testing.assert_array_equal(array, expect.neighbour.arrays()[name])
+        self.assertEqual(meta.seq_index, expect.seq_index)
+        self.assertAlmostEqual(calculator.calculate(), Ruggness(expect).calculate())
+
+    def test_add_variants_large_effect(self):
+        """test incremental updates stay exact when mutation effects outgrow their spread"""
+        rng = np.random.default_rng(7)
+        sequences = ["".join(seq) for seq in itertools.product("ACDE", repeat=5)]
+        sequences = [sequences[i] for i in rng.permutation(len(sequences))[:600]]
+        effect = rng.normal(size=(5, 4)) * 1e7
+        fitness = np.array([sum(effect[i, "ACDE".index(char)] for i, char in enumerate(seq))
+                            for seq in sequences]) + rng.normal(size=len(sequences))
+
+        def build(index):
+            part = Scenery()
+            part.sequence = [sequences[i] for i in index]
+            part.fitness = fitness[index]
+            meta = MetaData(part, "ACDE", cache=False)
+            meta.get_neighbour(tqdm_enable=False)
+            return meta
+
+        calculator = IncrementalRuggness(build(list(range(300))))
+        calculator.add_variants(sequences[300:], fitness[300:])
+        calculator.remove_variants(sequences[:100])
+        calculator.update_fitness(sequences[100:150], fitness[100:150] + 1.0)
+        fitness[100:150] += 1.0
+        expect = Ruggness(build(list(range(100, 600)))).calculate()
+        self.assertAlmostEqual(calculator.calculate() / expect, 1.0)
+
+    def test_neighbour_cache(self):
+        """test neighbour graph is loaded from cache on second run"""
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "ATA",
+                            "TAA", "ATT", "TAT", "TTA", "TTT"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0]
+
+        with TemporaryDirectory() as folder:
+            cache = NeighbourCache(folder)
+            first = MetaData(scenery, "AT", cache)
+            first.get_neighbour(tqdm_enable=False)
+            second = MetaData(scenery, "AT", cache)
+            second.get_neighbour(tqdm_enable=False)
+
+            self.assertIsInstance(second.neighbour.target, np.memmap)
+            for name, array in first.neighbour.arrays().items():
+                self.assertEqual(
+                    array.tolist(), getattr(second.neighbour, name).tolist())
+            self.assertAlmostEqual(Ruggness(second).calculate(), 0.0252, places=3)
+
+            NeighbourCache(folder, max_bytes=0).evict()
+            self.assertEqual(os.listdir(folder), [])
+
+    def test_neighbour_graph(self):
+        """test neighbour graph of a full hypercube"""
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "ATA",
+                            "TAA", "ATT", "TAT", "TTA", "TTT"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0]
+
+        meta = MetaData(scenery, "AT")
+        meta.get_neighbour(tqdm_enable=False)
+
+        self.assertEqual(len(meta.neighbour), 8)
+        self.assertEqual(meta.neighbour.edge_num, 24)
+        items = {(item.target, item.diff, item.index)
+                 for item in meta.neighbour[0]}
+        self.assertEqual(
+            items, {(3, "AT", (0,)), (2, "AT", (1,)), (1, "AT", (2,))})
+
+    def test_mutation_neighbour(self):
+        """test neighbours of mutation sets against neighbours of sequences"""
+        args = MutArgs()
+        args.fitness_label = "score"
+        args.mutation_label = "variant"
+        args.vt_offset = 0
+        args.wile_type = "AAA"
+
+        path = join(dirname(__file__), "data/mut.csv")
+        scenery = MutParser.parse(path, args)
+        mutation = MetaData(scenery, "AT", cache=False)
+        # substitutions of the parser are those of the encoded sequences
+        expect = MutationSet.from_matrix(mutation.matrix, mutation.mutation.wild_code)
+        for name in ["indptr", "position", "code"]:
+            np.testing.assert_array_equal(getattr(mutation.mutation, name),
+                                          getattr(expect, name))
+        np.testing.assert_array_equal(
+            mutation.variable_positions,
+            np.flatnonzero((mutation.matrix != mutation.matrix[:1]).any(axis=0)))
+        mutation.get_neighbour(tqdm_enable=False)
+
+        scenery.wild_type = None
+        sequence = MetaData(scenery, "AT", cache=False)
+        sequence.get_neighbour(tqdm_enable=False)
+
+        for name, array in sequence.neighbour.arrays().items():
+            np.testing.assert_array_equal(
+                mutation.neighbour.arrays()[name], array)
+        self.assertAlmostEqual(Ruggness(mutation).calculate(),
+                               Ruggness(sequence).calculate())
+
+    def test_variable_positions(self):
+        """test constant residues are left out of neighbours and epistasis"""
+        chars = list("AT")
+
+        scenery = Scenery()
+        scenery.sequence = ["AAAAA", "AAATA", "ATAAA", "TAAAA",
+                            "ATATA", "TAATA", "TTAAA", "TTATA"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0]
+
+        meta = MetaData(scenery, chars, cache=False)
+        self.assertEqual(meta.variable_positions.tolist(), [0, 1, 3])
+        meta.get_neighbour(tqdm_enable=False)
+        self.assertEqual(meta.neighbour.edge_num, 24)
+        self.assertEqual(set(meta.neighbour.position.tolist()), {0, 1, 3})
+
+        epi = Epistasis(scenery, 3, chars, backend="sequential",
+                        cache=False).calculate()
+        self.assertEqual(set(epi), {(0,), (1,), (3,), (0, 1), (0, 3),
+                                    (1, 3), (0, 1, 3)})
+        percent_1 = epi[(1,)][('A',)] / epi[(0,)][('A',)]
+        percent_3 = epi[(3,)][('A',)] / epi[(0,)][('A',)]
+        self.assertAlmostEqual(percent_1, 0.7647, places=3)
+        self.assertAlmostEqual(percent_3, 0.2941, places=3)
 
     def test_calculate_epi(self):
         """test calculate epistasis"""
@@ -70,3 +482,247 @@ class TestLibCall(unittest.TestCase):
 
         self.assertAlmostEqual(percent_1, 0.7647, places=3)
         self.assertAlmostEqual(percent_2, 0.2941, places=3)
+
+    def test_epi_connected(self):
+        """test epistasis only reports combinations which have a neighbour"""
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "TTA"]
+        scenery.fitness = [0.1, 0.3, 0.5]
+
+        epi = Epistasis(scenery, 2, "AT", cache=False).calculate()
+        self.assertEqual(epi[(0,)], {})
+        self.assertEqual(epi[(0, 1)], {})
+        self.assertEqual(set(epi[(2,)]), {("A",), ("T",)})
+        self.assertAlmostEqual(epi[(2,)][("A",)] - epi[(2,)][("T",)], 0.2)
+        # `TTA` has no neighbour, but is a combination of the dataset
+        self.assertEqual(set(epi[(0, 2)]), {("A", "A"), ("A", "T")})
+
+    def test_epi_backends(self):
+        """test epistasis is the same on every scheduler backend"""
+        chars = list("AT")
+
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "ATA",
+                            "TAA", "ATT", "TAT", "TTA", "TTT"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0]
+
+        expect = Epistasis(scenery, 3, chars, backend="sequential").calculate()
+        for backend in ["threading", "loky"]:
+            epi = Epistasis(scenery, 3, chars, n_jobs=2,
+                            batch_size=2, backend=backend).calculate()
+            self.assertEqual(epi.keys(), expect.keys())
+            for key, value in expect.items():
+                for seq, one in value.items():
+                    self.assertAlmostEqual(epi[key][seq], one)
+
+    def test_epi_iter_orders(self):
+        """test epistasis yielded order by order"""
+        chars = list("AT")
+
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "ATA",
+                            "TAA", "ATT", "TAT", "TTA", "TTT"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0]
+
+        calculator = Epistasis(scenery, 3, chars, backend="sequential")
+        orders = []
+        for order, epi in calculator.iter_orders():
+            orders.append(order)
+            self.assertTrue(all(len(key) == order for key in epi))
+            if order == 2:
+                break
+
+        self.assertEqual(orders, [1, 2])
+        percent_1 = calculator.epi_net[(1,)][('A',)] / \
+            calculator.epi_net[(0,)][('A',)]
+        self.assertAlmostEqual(percent_1, 0.7647, places=3)
+
+    def test_epi_from_diff(self):
+        """test epistasis of every connected component"""
+        diff = {(("A",), ("T",)): 1.0, (("C",), ("G",)): -2.0}
+        epi = get_epi_from_diff(diff, [("A",), ("C",), ("G",), ("T",)])
+
+        self.assertEqual(
+            epi, {("A",): -0.5, ("T",): 0.5, ("C",): 1.0, ("G",): -1.0})
+
+    def test_epi_lsq(self):
+        """test least-squares epistasis agrees with spanning tree on additive fitness"""
+        chars = list("AT")
+
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "ATA",
+                            "TAA", "ATT", "TAT", "TTA", "TTT"]
+        scenery.fitness = [sum(0.1 * (i + 1) * (char == "T") for i, char in enumerate(seq))
+                           for seq in scenery.sequence]
+
+        tree = Epistasis(scenery, 3, chars, backend="sequential").calculate()
+        lsq = Epistasis(scenery, 3, chars, backend="sequential",
+                        solver="lsq").calculate()
+        for key, value in tree.items():
+            for seq, one in value.items():
+                self.assertAlmostEqual(lsq[key][seq], one, places=6)
+
+    def test_epi_lsq_cycle(self):
+        """test least-squares epistasis of averaged deltas around an inconsistent cycle"""
+        scenery = Scenery()
+        # `TTT` is missing, so deltas of residues (0, 1) are averaged over
+        # different backgrounds and do not sum to zero around their cycle
+        scenery.sequence = ["AAA", "AAT", "ATA", "TAA", "ATT", "TAT", "TTA"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.9, 0.8]
+
+        tree = Epistasis(scenery, 2, "AT", cache=False).calculate()
+        calculator = Epistasis(scenery, 2, "AT", cache=False, solver="lsq")
+        lsq = calculator.calculate()
+        nodes, source, target, delta = key_system(
+            (0, 1), calculator.matrix, calculator.fitness,
+            calculator.cal_epi_link(calculator.meta.neighbour))
+        incidence = np.zeros((len(delta), len(nodes)))
+        incidence[np.arange(len(delta)), target] = 1.0
+        incidence[np.arange(len(delta)), source] = -1.0
+        # the least-norm solution of a connected graph has mean of zero
+        dense = np.linalg.lstsq(incidence, delta, rcond=None)[0]
+        self.assertGreater(np.abs(incidence @ dense - delta).max(), 0.01)
+
+        for codes, value in zip(nodes, dense):
+            seq = tuple("AT"[code] for code in codes)
+            expect = value - lsq[(0,)][seq[:1]] - lsq[(1,)][seq[1:]]
+            self.assertAlmostEqual(lsq[(0, 1)][seq], expect, places=6)
+        self.assertGreater(max(abs(lsq[(0, 1)][seq] - tree[(0, 1)][seq])
+                               for seq in tree[(0, 1)]), 0.01)
+
+    def test_synthetic_landscape(self):
+        """test synthetic landscapes are reproducible and benchmarked by stage"""
+        for model in ["additive", "pairwise", "nk"]:
+            one = synthetic_scenery(5, 3, missing=0.25, model=model, k=2, seed=1)
+            two = synthetic_scenery(5, 3, missing=0.25, model=model, k=2, seed=1)
+            self.assertEqual(one.matrix.shape, (182, 5))
+            self.assertEqual(len(np.unique(one.matrix, axis=0)), 182)
+            np.testing.assert_array_equal(one.matrix, two.matrix)
+            np.testing.assert_array_equal(one.fitness, two.fitness)
+        self.assertEqual(synthetic_scenery(40, 20, sequence_num=100).matrix.shape,
+                         (100, 40))
+
+        records = run_case(BenchCase(4, 2, max_order=2), repeat=1)
+        self.assertEqual([record["stage"] for record in records],
+                         ["parse-csv", "parse-bin", "neighbour", "ruggness",
+                          "epistasis-1", "epistasis-2"])
+        self.assertEqual(records[2]["edges"], 64)
+        self.assertEqual(records[5]["keys"], 6)
+        self.assertTrue(all(record["peak_bytes"] > 0 for record in records))
+
+    def test_profiling(self):
+        """test stages and counters of a profiled epistasis"""
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "ATA",
+                            "TAA", "ATT", "TAT", "TTA", "TTT"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0]
+
+        self.assertIs(metrics.stage("neighbour"), metrics.NULL_STAGE)
+        with metrics.profiling() as report:
+            Epistasis(scenery, 3, "AT", backend="sequential", cache=False).calculate()
+        self.assertIsNone(metrics.ACTIVE)
+
+        stages = report.to_dict()["stages"]
+        for name in ["encode", "neighbour", "epi_link", "solve", "substitute"]:
+            self.assertGreaterEqual(stages[name]["calls"], 1)
+            self.assertGreater(stages[name]["peak_bytes"], 0)
+        self.assertEqual(report.counters["neighbour.candidates"], 24)
+        self.assertEqual(report.counters["neighbour.edges"], 24)
+        self.assertEqual(report.counters["epistasis.keys"], 7)
+        self.assertEqual(report.counters["epistasis.components"], 7)
+        self.assertEqual(report.counters["epistasis.combinations"], 26)
+
+    def test_progress(self):
+        """test progress is reported chunk by chunk"""
+        class Recorder(Progress):
+            """record every event of progress"""
+
+            def __init__(self):
+                self.events = []
+
+            def start(self, task, total=None):
+                self.events.append(("start", task, total))
+
+            def advance(self, task, done=1):
+                self.events.append(("advance", task, done))
+
+            def finish(self, task):
+                self.events.append(("finish", task, None))
+
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "ATA",
+                            "TAA", "ATT", "TAT", "TTA", "TTT"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0]
+
+        recorder = Recorder()
+        Epistasis(scenery, 3, "AT", batch_size=2, backend="sequential",
+                  cache=False, progress=recorder).calculate()
+        for task, total in [("creating neighbour", 3), ("epistasis order 1", 3),
+                            ("epistasis order 2", 3), ("epistasis order 3", 1)]:
+            self.assertIn(("start", task, total), recorder.events)
+            self.assertIn(("finish", task, None), recorder.events)
+            self.assertEqual(sum(done for event, one, done in recorder.events
+                                 if event == "advance" and one == task), total)
+        self.assertIn(("advance", "epistasis order 1", 2), recorder.events)
+
+        with self.assertLogs("cliff.progress") as logs:
+            progress = LogProgress(interval=0)
+            progress.start("task", 2)
+            progress.advance("task")
+            progress.finish("task")
+        self.assertEqual(len(logs.output), 3)
+        self.assertIn('"done": 1', logs.output[-1])
+
+    def test_epi_pruned(self):
+        """test epistasis restricted to residues, groups and supported keys"""
+        chars = list("AT")
+
+        scenery = Scenery()
+        scenery.sequence = ["AAA", "AAT", "ATA",
+                            "TAA", "ATT", "TAT", "TTA", "TTT"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.6, 0.8, 1.0]
+        full = Epistasis(scenery, 3, chars, backend="sequential", cache=False).calculate()
+
+        epi = Epistasis(scenery, 3, chars, backend="sequential", cache=False,
+                        positions=[0, 2]).calculate()
+        self.assertEqual(set(epi), {(0,), (2,), (0, 2)})
+        self.assertAlmostEqual(epi[(2,)][('A',)], full[(2,)][('A',)])
+
+        epi = Epistasis(scenery, 3, chars, backend="sequential", cache=False,
+                        groups=[[0, 1], [1, 2]]).calculate()
+        self.assertEqual(set(epi), {(0,), (1,), (2,), (0, 1), (1, 2)})
+
+        epi = Epistasis(scenery, 3, chars, backend="sequential", cache=False,
+                        prune=lambda key, support: key == (0, 2)).calculate()
+        self.assertEqual(set(epi), {(0,), (1,), (2,), (0, 1), (1, 2)})
+
+        # without TAT and TTT, few sequences have neighbours at residue 0 and 2
+        scenery.sequence = ["AAA", "AAT", "ATA", "TAA", "ATT", "TTA"]
+        scenery.fitness = [0.1, 0.2, 0.4, 0.3, 0.3, 0.8]
+        calculator = Epistasis(scenery, 3, chars, backend="sequential", cache=False,
+                               min_support=3)
+        epi = calculator.calculate()
+        self.assertEqual(set(epi), {(0,), (1,), (2,), (0, 1), (1, 2)})
+        support = KeySupport(calculator.meta.neighbour, [0, 1, 2])
+        self.assertEqual([support.count(key) for key in [(0,), (1,), (0, 2), (0, 1, 2)]],
+                         [4, 6, 2, 2])
+
+    def test_key_index(self):
+        """test integer ids of epistasis keys and their subsets"""
+        self.assertEqual(subset_columns(3), ((0,), (1,), (2,), (0, 1), (0, 2), (1, 2)))
+        residues = [2, 5, 7, 9]
+        index = KeyIndex(residues, 3)
+        keys = [key for order in range(1, 4)
+                for key in itertools.combinations(residues, order)]
+        ids = np.concatenate([index.rank(np.array([key for key in keys if len(key) == order]))
+                              for order in range(1, 4)])
+        self.assertEqual(sorted(ids.tolist()), list(range(len(keys))))
+
+        table = EpiTable(keys, index, 2)
+        key = (2, 7, 9)
+        self.assertEqual([keys[i] for i in table.subset_ids[table.key_id[key]]],
+                         [subset for order in range(1, len(key))
+                          for subset in itertools.combinations(key, order)])
+        supersets = table.superset[table.indptr[table.key_id[(5,)]]:
+                                   table.indptr[table.key_id[(5,)] + 1]]
+        self.assertEqual(len(supersets), 3 + 3)